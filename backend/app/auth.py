@@ -1,10 +1,14 @@
 import os
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event, inspect as sa_inspect
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 from .database import get_db
@@ -14,6 +18,10 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "dev_secret_change_me")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "120"))
+# per process: the ORM listener below evicts on this worker only, so other workers (and bulk/raw SQL
+# updates of is_active) see a deactivation after at most this many seconds
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/login")
@@ -27,14 +35,73 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_account(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> Account:
-    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+class _PrincipalCache:
+    """token -> (expires, claims, account id, username, is_active); bounded by TTL and token expiry."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[token]
+                return None
+            return entry[1:]
+
+    def put(self, token: str, claims: dict, account: Account) -> None:
+        expires = time.monotonic() + self.ttl
+        if "exp" in claims:
+            expires = min(expires, time.monotonic() + (claims["exp"] - time.time()))
+        with self._lock:
+            self._entries[token] = (expires, claims, account.id, account.username, account.is_active)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_username(self, username: str) -> None:
+        with self._lock:
+            for token in [t for t, e in self._entries.items() if e[3] == username]:
+                del self._entries[token]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = _PrincipalCache(PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_SIZE)
+
+@event.listens_for(Account.is_active, "set", active_history=True)
+def _on_account_active_change(target, value, oldvalue, initiator):
+    # deactivation must take effect on the next request, not after the TTL;
+    # transient instances are the cache's own snapshots
+    if not sa_inspect(target).transient and value != oldvalue:
+        principal_cache.invalidate_username(target.username)
+
+def account_from_token(db: Session, token: str) -> Optional[Account]:
+    cached = principal_cache.get(token)
+    if cached is not None:
+        _, account_id, username, is_active = cached
+        # detached snapshot: callers only read id/username/is_active
+        return Account(id=account_id, username=username, is_active=is_active) if is_active else None
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
         username: str = payload.get("sub")
-        if username is None: raise credentials_exception
+        if username is None: return None
     except JWTError:
-        raise credentials_exception
+        return None
     account = db.query(Account).filter(Account.username == username).first()
-    if account is None or not account.is_active: raise credentials_exception
+    if account is None: return None
+    principal_cache.put(token, payload, account)
+    if not account.is_active: return None
+    return account
+
+def get_current_account(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> Account:
+    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
+    account = account_from_token(db, token)
+    if account is None: raise credentials_exception
     return account
@@ -0,0 +1,39 @@
+import time
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from .database import Base, engine, SessionLocal
+from .models import Attendance, Person
+from .rollups import backfill_if_empty
+from .sessions import backfill_sessions_if_empty
+from .seed import seed
+from ..core.database import ensure_attendances_view
+
+def init_db() -> float:
+    """Create tables, indexes and the attendances view, backfill derived tables and seed. Idempotent. Returns seconds taken."""
+    started = time.perf_counter()
+    Base.metadata.create_all(bind=engine)
+    # create_all skips indexes on tables that already exist
+    for index in (*Attendance.__table__.indexes, *Person.__table__.indexes):
+        try:
+            index.create(bind=engine, checkfirst=True)
+        except IntegrityError:
+            print(f"Could not create {index.name}: existing rows violate it")
+    # older databases also carry a plain index on persons.name; once the unique one exists it is redundant
+    if any(ix["name"] == "ux_persons_name" for ix in inspect(engine).get_indexes("persons")):
+        with engine.begin() as con:
+            con.exec_driver_sql("DROP INDEX IF EXISTS ix_persons_name")
+    ensure_attendances_view(engine)
+    with SessionLocal() as db:
+        backfill_if_empty(db)
+        backfill_sessions_if_empty(db)
+        seed(db)
+    return time.perf_counter() - started
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="One-shot deploy step: create the schema and attendances view, backfill rollups/sessions and seed. "
+                    "Run it before starting workers with DB_INIT_ON_STARTUP=0."
+    )
+    parser.parse_args()
+    print(f"Database initialised in {init_db():.2f}s")
@@ -1,41 +1,61 @@
 from fastapi import APIRouter, Depends
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from typing import Dict, List
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
 from .database import get_db
-from .models import Attendance, Person
+from .models import Attendance, AttendanceRollup, Person
 from .auth import get_current_account, Account
 
 router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
 
+MAX_RANGE_DAYS = 365
+
 def _utc_midnight(dt: datetime) -> datetime:
     return datetime(dt.year, dt.month, dt.day)
 
+def _day_key(d) -> str:
+    # rollup days load as date; raw date() expressions come back as text on SQLite
+    return d.strftime("%Y-%m-%d") if isinstance(d, (date, datetime)) else str(d)[:10]
+
+def _emotion_counts(db: Session, start: datetime, end: datetime) -> Dict[str, int]:
+    rows = (
+        db.query(Attendance.emotion, func.count(Attendance.id))
+        .filter(Attendance.timestamp >= start, Attendance.timestamp <= end)
+        .group_by(Attendance.emotion)
+        .all()
+    )
+    return {emotion: count for emotion, count in rows}
+
+def _rollup_emotion_counts(db: Session, first_day: date, last_day: date) -> Dict[str, int]:
+    rows = (
+        db.query(AttendanceRollup.emotion, func.sum(AttendanceRollup.count))
+        .filter(AttendanceRollup.day >= first_day, AttendanceRollup.day <= last_day)
+        .group_by(AttendanceRollup.emotion)
+        .all()
+    )
+    return {emotion: int(count) for emotion, count in rows}
+
 @router.get("/summary")
 def summary(db: Session = Depends(get_db), _: Account = Depends(get_current_account)):
     now = datetime.utcnow()
     start_today = _utc_midnight(now)
-    # Attendance today
-    today_rows = (
-        db.query(Attendance)
-        .filter(Attendance.timestamp >= start_today, Attendance.timestamp <= now)
-        .all()
+    # Attendance today / unique people today
+    attendance_today, unique_people = (
+        db.query(func.coalesce(func.sum(AttendanceRollup.count), 0), func.count(func.distinct(AttendanceRollup.person_id)))
+        .filter(AttendanceRollup.day == start_today.date())
+        .one()
     )
-    attendance_today = len(today_rows)
-    # Unique people today
-    unique_people = len(set(a.person_id for a in today_rows))
 
     # Emotion distribution today
-    emotions_today: Dict[str, int] = {}
-    for a in today_rows:
-        emotions_today[a.emotion] = emotions_today.get(a.emotion, 0) + 1
+    emotions_today = _rollup_emotion_counts(db, start_today.date(), start_today.date())
 
     # Total users
-    total_users = db.query(Person).count()
+    total_users = db.query(func.count(Person.id)).scalar()
 
     # Last attendance
     last_row = (
-        db.query(Attendance)
+        db.query(Person.name, Attendance.emotion, Attendance.timestamp)
         .join(Person, Attendance.person_id == Person.id)
         .order_by(Attendance.timestamp.desc())
         .first()
@@ -43,7 +63,7 @@ def summary(db: Session = Depends(get_db), _: Account = Depends(get_current_acco
     last_attendance = None
     if last_row:
         last_attendance = {
-            "name": last_row.person.name,
+            "name": last_row.name,
             "emotion": last_row.emotion,
             "timestamp": last_row.timestamp.isoformat(),
         }
@@ -58,45 +78,65 @@ def summary(db: Session = Depends(get_db), _: Account = Depends(get_current_acco
 
 @router.get("/attendance_daily")
 def attendance_daily(days: int = 7, db: Session = Depends(get_db), _: Account = Depends(get_current_account)):
-    days = max(1, min(days, 30))
+    days = max(1, min(days, MAX_RANGE_DAYS))
     end = datetime.utcnow()
     start = _utc_midnight(end - timedelta(days=days - 1))
     rows = (
-        db.query(Attendance)
-        .filter(Attendance.timestamp >= start, Attendance.timestamp <= end)
+        db.query(AttendanceRollup.day, func.sum(AttendanceRollup.count))
+        .filter(AttendanceRollup.day >= start.date(), AttendanceRollup.day <= end.date())
+        .group_by(AttendanceRollup.day)
         .all()
     )
-    
+
     buckets: Dict[str, int] = {}
     for i in range(days):
         d = start + timedelta(days=i)
         buckets[d.strftime("%Y-%m-%d")] = 0
-    for a in rows:
-        key = _utc_midnight(a.timestamp).strftime("%Y-%m-%d")
+    for d, count in rows:
+        key = _day_key(d)
         if key in buckets:
-            buckets[key] += 1
+            buckets[key] += int(count)
     return [{"date": k, "count": buckets[k]} for k in sorted(buckets.keys())]
 
 @router.get("/emotions")
 def emotions(days: int = 7, db: Session = Depends(get_db), _: Account = Depends(get_current_account)):
-    days = max(1, min(days, 30))
+    days = max(1, min(days, MAX_RANGE_DAYS))
     end = datetime.utcnow()
     start = end - timedelta(days=days)
-    rows = (
-        db.query(Attendance)
-        .filter(Attendance.timestamp >= start, Attendance.timestamp <= end)
-        .all()
-    )
-    agg: Dict[str, int] = {}
-    for a in rows:
-        agg[a.emotion] = agg.get(a.emotion, 0) + 1
+    # the window starts mid-day: take that partial day from raw rows, whole days from the rollup
+    next_midnight = _utc_midnight(start) + timedelta(days=1)
+    agg = _emotion_counts(db, start, next_midnight - timedelta(microseconds=1))
+    for emotion, count in _rollup_emotion_counts(db, next_midnight.date(), end.date()).items():
+        agg[emotion] = agg.get(emotion, 0) + count
     return {"days": days, "distribution": agg}
 
+@router.get("/trends")
+def trends(
+    days: int = 365,
+    person_id: Optional[int] = None,
+    emotion: Optional[str] = None,
+    db: Session = Depends(get_db),
+    _: Account = Depends(get_current_account),
+):
+    days = max(1, min(days, MAX_RANGE_DAYS))
+    first_day = (datetime.utcnow() - timedelta(days=days - 1)).date()
+    q = db.query(AttendanceRollup.day, AttendanceRollup.emotion, func.sum(AttendanceRollup.count)).filter(AttendanceRollup.day >= first_day)
+    if person_id is not None:
+        q = q.filter(AttendanceRollup.person_id == person_id)
+    if emotion is not None:
+        q = q.filter(AttendanceRollup.emotion == emotion)
+    rows = q.group_by(AttendanceRollup.day, AttendanceRollup.emotion).order_by(AttendanceRollup.day).all()
+    return {
+        "days": days,
+        "person_id": person_id,
+        "series": [{"date": _day_key(d), "emotion": e, "count": int(n)} for d, e, n in rows],
+    }
+
 @router.get("/recent")
 def recent(limit: int = 10, db: Session = Depends(get_db), _: Account = Depends(get_current_account)):
     limit = max(1, min(limit, 50))
     rows = (
-        db.query(Attendance)
+        db.query(Person.name, Attendance.emotion, Attendance.timestamp)
         .join(Person, Attendance.person_id == Person.id)
         .order_by(Attendance.timestamp.desc())
         .limit(limit)
@@ -104,7 +144,7 @@ def recent(limit: int = 10, db: Session = Depends(get_db), _: Account = Depends(
     )
     return [
         {
-            "name": r.person.name,
+            "name": r.name,
             "emotion": r.emotion,
             "timestamp": r.timestamp.isoformat(),
         }
@@ -0,0 +1,84 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+DEDUP_WINDOW_MINUTES = int(os.getenv("DEDUP_WINDOW_MINUTES", "2"))
+DEDUP_INDEX_MAX_ENTRIES = int(os.getenv("DEDUP_INDEX_MAX_ENTRIES", "200000"))
+# "1" only when this process is the sole writer of marks (single uvicorn worker): a miss is then
+# a definite "no recent mark"; otherwise misses fall back to the database.
+DEDUP_INDEX_AUTHORITATIVE = os.getenv("DEDUP_INDEX_AUTHORITATIVE", "0") == "1"
+
+Entry = Tuple[datetime, int]
+
+
+def user_key(person_id: int) -> Tuple[str, int]:
+    # latest mark of any emotion; namespaced so it never collides with a (person_id, emotion) key
+    return ("user", int(person_id))
+
+
+class DedupIndex:
+    """Last mark time (and row id) per key, e.g. (person_id, emotion), kept only as long as the window."""
+
+    def __init__(self, window: timedelta, max_entries: int = DEDUP_INDEX_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # insertion order == recording order, so the oldest marks sit at the front
+        self._last: Dict[Hashable, Entry] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self, now: datetime) -> None:
+        cutoff = now - self.window
+        while self._last:
+            key = next(iter(self._last))
+            if self._last[key][0] >= cutoff and len(self._last) <= self.max_entries:
+                break
+            del self._last[key]
+
+    def lookup(self, key: Hashable, now: datetime, window: Optional[timedelta] = None) -> Optional[Entry]:
+        window = window or self.window
+        with self._lock:
+            entry = self._last.get(key)
+            if entry is not None and entry[0] >= now - window:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def record(self, key: Hashable, ts: datetime, row_id: int) -> None:
+        with self._lock:
+            current = self._last.pop(key, None)
+            if current is not None and current[0] > ts:
+                ts, row_id = current
+            self._last[key] = (ts, row_id)
+            self._evict(max(ts, datetime.utcnow()))
+
+    def record_mark(self, person_id: int, emotion: str, ts: datetime, row_id: int) -> None:
+        """Index a stored mark under both keys the app looks up: (person_id, emotion) and user_key(person_id)."""
+        self.record((person_id, emotion), ts, row_id)
+        self.record(user_key(person_id), ts, row_id)
+
+    def warm(self, rows: Iterable[Tuple[Hashable, datetime, int]]) -> int:
+        n = 0
+        for key, ts, row_id in sorted(rows, key=lambda r: r[1]):
+            self.record(key, ts, row_id)
+            n += 1
+        return n
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._last), "hits": self.hits, "misses": self.misses}
+
+
+dedup_index = DedupIndex(timedelta(minutes=DEDUP_WINDOW_MINUTES))
+
+
+def warm_from_db(index: DedupIndex, db) -> int:
+    from .models import Attendance
+    since = datetime.utcnow() - index.window
+    rows = db.query(Attendance.id, Attendance.person_id, Attendance.emotion, Attendance.timestamp).filter(Attendance.timestamp >= since)
+    return index.warm(
+        entry for r in rows for entry in (((r.person_id, r.emotion), r.timestamp, r.id), (user_key(r.person_id), r.timestamp, r.id))
+    )
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from queue import LifoQueue, Empty
+from typing import Any, Callable, Dict
+import numpy as np
+from .lazy import LazyModule
+
+# mediapipe alone is most of a worker's import time; loaded by the first detector built
+mp = LazyModule("mediapipe")
+
+DETECTOR_POOL_SIZE = int(os.getenv("DETECTOR_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+DETECTOR_POOL_TIMEOUT = float(os.getenv("DETECTOR_POOL_TIMEOUT", "10"))
+# uvicorn reads WEB_CONCURRENCY for its worker count; every worker owns a pool, so split the cores between them
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DETECTOR_PROCESSES = int(os.getenv("DETECTOR_PROCESSES", str(max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))))
+
+_WARMUP_FRAME = np.zeros((64, 64, 3), dtype=np.uint8)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class DetectorPool:
+    """Fixed-size pool of long-lived MediaPipe graphs, built lazily once per process."""
+
+    def __init__(self, name: str, factory: Callable[[], Any], size: int = DETECTOR_POOL_SIZE):
+        self.name = name
+        self.factory = factory
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._q: LifoQueue = LifoQueue()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.rebuilds = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _build(self):
+        inst = self.factory()
+        inst.process(_WARMUP_FRAME)
+        return inst
+
+    def warm_up(self) -> None:
+        # MediaPipe graphs do not survive fork, so each process builds its own set
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            q: LifoQueue = LifoQueue()
+            for _ in range(self.size):
+                q.put(self._build())
+            self._q = q
+            self._pid = os.getpid()
+
+    @contextmanager
+    def checkout(self, timeout: float = DETECTOR_POOL_TIMEOUT):
+        """Yield (instance, seconds waited). Keep only the process() call inside the block: an instance
+        whose block raised is closed instead of returned, and its slot is rebuilt by a later checkout."""
+        self.warm_up()
+        t0 = time.perf_counter()
+        try:
+            inst = self._q.get(timeout=timeout)
+        except Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No free {self.name} detector after {timeout:.1f}s")
+        if inst is None:
+            # slot left empty by a failed instance; a failed build leaves it empty for the next caller
+            try:
+                inst = self._build()
+            except BaseException:
+                self._q.put(None)
+                raise
+            with self._lock:
+                self.rebuilds += 1
+        waited = time.perf_counter() - t0
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        healthy = False
+        try:
+            yield inst, waited
+            healthy = True
+        finally:
+            if healthy:
+                self._q.put(inst)
+            else:
+                self._q.put(None)
+                try:
+                    inst.close()
+                except Exception:
+                    pass
+
+    def close(self) -> None:
+        with self._lock:
+            while True:
+                try:
+                    inst = self._q.get_nowait()
+                except Empty:
+                    break
+                if inst is not None:
+                    inst.close()
+            self._pid = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "available": self._q.qsize() if self._pid == os.getpid() else 0,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "rebuilds": self.rebuilds,
+                "wait_avg_ms": round(1000 * self.wait_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(1000 * self.wait_max, 3),
+            }
+
+
+mesh_pool = DetectorPool(
+    "face_mesh",
+    lambda: mp.solutions.face_mesh.FaceMesh(static_image_mode=True, max_num_faces=5, refine_landmarks=True, min_detection_confidence=0.5),
+)
+detection_pool = DetectorPool(
+    "face_detection",
+    lambda: mp.solutions.face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5),
+)
+
+
+def new_tracking_mesh(max_num_faces: int = 1):
+    return mp.solutions.face_mesh.FaceMesh(static_image_mode=False, max_num_faces=max_num_faces, refine_landmarks=True,
+                                 min_detection_confidence=0.5, min_tracking_confidence=0.5)
+
+
+def warm_up() -> None:
+    mesh_pool.warm_up()
+    detection_pool.warm_up()
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {"face_mesh": mesh_pool.stats(), "face_detection": detection_pool.stats()}
+
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _init_worker() -> None:
+    # each worker process handles one image at a time, so one graph of each kind is enough
+    mesh_pool.size = 1
+    detection_pool.size = 1
+    warm_up()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                # spawn, not fork: forking a process that already runs MediaPipe threads is unsafe
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=max(1, DETECTOR_PROCESSES),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+    return _process_pool
+
+
+def reset_process_pool(broken: ProcessPoolExecutor) -> None:
+    """Forget a pool whose worker died (BrokenProcessPool); the next get_process_pool() starts a new one."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is broken:
+            _process_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_process_pool() -> None:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
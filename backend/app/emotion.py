@@ -1,85 +1,455 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
 from fastapi.responses import JSONResponse
-from typing import List, Dict, Any
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional, Tuple
 from io import BytesIO
-from PIL import Image
+import os
+import time
+import asyncio
+import traceback
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
-import cv2
-import mediapipe as mp
-from collections import deque
-from .auth import get_current_account
+from .auth import get_current_account, account_from_token
+from .database import SessionLocal
 from .models import Account
+from .history import history_engine, HISTORY_DEFAULT_WINDOW, GLOBAL_SOURCE
+from .result_cache import result_cache, content_key, perceptual_hash, CACHE_ENABLED, CACHE_PHASH
+from .lazy import LazyModule, load_all, lazy_report
+from .detectors import mesh_pool, detection_pool, pool_stats, get_process_pool, reset_process_pool, new_tracking_mesh, PoolTimeout
+from . import detectors
 
-router = APIRouter(prefix="/api/emotion", tags=["emotion"])
+Image = LazyModule("PIL.Image")
 
-mp_face_mesh = mp.solutions.face_mesh
-mp_face_detection = mp.solutions.face_detection
+BATCH_MAX_IMAGES = int(os.getenv("EMOTION_BATCH_MAX_IMAGES", "32"))
+STREAM_KEYFRAME_INTERVAL = int(os.getenv("EMOTION_STREAM_KEYFRAME_INTERVAL", "30"))
+STREAM_MAX_FACES = int(os.getenv("EMOTION_STREAM_MAX_FACES", "1"))
+MAX_UPLOAD_BYTES = int(os.getenv("EMOTION_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+INFER_MAX_SIDE = int(os.getenv("EMOTION_INFER_MAX_SIDE", "640"))
+# multipart boundary and part headers on top of each image
+UPLOAD_PART_OVERHEAD = 16 * 1024
+DETECT_MODE = os.getenv("EMOTION_DETECT_MODE", "full")
+CASCADE_PAD = float(os.getenv("EMOTION_CASCADE_PAD", "0.25"))
+
+# whole-request caps, checked while the body arrives; read_upload still bounds each image
+UPLOAD_BODY_LIMITS = {
+    "/api/emotion/detect": MAX_UPLOAD_BYTES + UPLOAD_PART_OVERHEAD,
+    "/api/emotion/detect_batch": BATCH_MAX_IMAGES * (MAX_UPLOAD_BYTES + UPLOAD_PART_OVERHEAD),
+}
+
+
+def _body_too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Request body exceeds {limit} bytes.")
+
+
+class BoundedUploadRoute(APIRoute):
+    """Enforces UPLOAD_BODY_LIMITS before FastAPI parses and spools the multipart form: an oversized
+    Content-Length is refused without reading the body, and a body that grows past the cap anyway
+    (chunked, or a wrong header) is cut off as it streams in."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        limit = UPLOAD_BODY_LIMITS.get(self.path)
+        if limit is None:
+            return handler
+
+        async def bounded_handler(request: Request) -> Response:
+            length = request.headers.get("content-length")
+            if length and length.isdigit() and int(length) > limit:
+                raise _body_too_large(limit)
+            received = 0
+
+            async def receive():
+                nonlocal received
+                message = await request.receive()
+                if message["type"] == "http.request":
+                    received += len(message.get("body", b""))
+                    if received > limit:
+                        raise _body_too_large(limit)
+                return message
+
+            return await handler(Request(request.scope, receive))
+
+        return bounded_handler
+
+
+router = APIRouter(prefix="/api/emotion", tags=["emotion"], route_class=BoundedUploadRoute)
 
-HISTORY_SIZE = 200
-history = deque(maxlen=HISTORY_SIZE)
 
 LM = { "mouth_left": 61, "mouth_right": 291, "mouth_top": 13, "mouth_bottom": 14, "left_brow": 105, "right_brow": 334, "left_eye_top": 159, "right_eye_top": 386 }
 
-def _dist(a, b): return float(np.linalg.norm(np.array(a) - np.array(b)))
+EMOTIONS = ("Surprised", "Happy", "Angry", "Sad", "Neutral")
+NUM_LANDMARKS = 478
 
-def classify_emotion_from_landmarks(landmarks: np.ndarray) -> Dict[str, float]:
-    pts = {name: landmarks[idx][:2] for name, idx in LM.items()}
-    mouth_w = _dist(pts["mouth_left"], pts["mouth_right"]) + 1e-6
-    mouth_h = _dist(pts["mouth_top"], pts["mouth_bottom"])
+def landmarks_to_array(multi_face_landmarks) -> np.ndarray:
+    faces = list(multi_face_landmarks)
+    if not faces:
+        return np.empty((0, NUM_LANDMARKS, 3), dtype=np.float32)
+    n = len(faces[0].landmark)
+    flat = np.fromiter(
+        (v for face in faces for lm in face.landmark for v in (lm.x, lm.y, lm.z)),
+        dtype=np.float32, count=len(faces) * n * 3,
+    )
+    return flat.reshape(len(faces), n, 3)
+
+def classify_emotions_batch(landmarks: np.ndarray) -> np.ndarray:
+    """(N, 478, 3) landmarks -> (N, len(EMOTIONS)) softmax probabilities, columns in EMOTIONS order."""
+    lm = np.asarray(landmarks, dtype=np.float64)[:, :, :2]
+    p = {name: lm[:, idx] for name, idx in LM.items()}
+    mouth_w = np.linalg.norm(p["mouth_left"] - p["mouth_right"], axis=1) + 1e-6
+    mouth_h = np.linalg.norm(p["mouth_top"] - p["mouth_bottom"], axis=1)
     open_ratio = mouth_h / mouth_w
-    lb_dist = abs(pts["left_brow"][1] - pts["left_eye_top"][1])
-    rb_dist = abs(pts["right_brow"][1] - pts["right_eye_top"][1])
+    lb_dist = np.abs(p["left_brow"][:, 1] - p["left_eye_top"][:, 1])
+    rb_dist = np.abs(p["right_brow"][:, 1] - p["right_eye_top"][:, 1])
     brow_eye = (lb_dist + rb_dist) / 2.0
 
     surprise = 3.0 * open_ratio + 2.0 * brow_eye
-    happy = max(0.0, 1.0 - abs(open_ratio - 0.25)) + 0.5 * max(0.0, brow_eye - 0.02)
-    angry = max(0.0, 0.25 - open_ratio) + max(0.0, 0.03 - brow_eye)
-    sad = max(0.0, 0.2 - open_ratio) + max(0.0, 0.02 - brow_eye)
-    neutral = 0.5
+    happy = np.maximum(0.0, 1.0 - np.abs(open_ratio - 0.25)) + 0.5 * np.maximum(0.0, brow_eye - 0.02)
+    angry = np.maximum(0.0, 0.25 - open_ratio) + np.maximum(0.0, 0.03 - brow_eye)
+    sad = np.maximum(0.0, 0.2 - open_ratio) + np.maximum(0.0, 0.02 - brow_eye)
+    neutral = np.full_like(open_ratio, 0.5)
 
-    scores = { "Surprised": surprise, "Happy": happy, "Angry": angry, "Sad": sad, "Neutral": neutral }
-    vals = np.array(list(scores.values()), dtype=np.float64)
-    exp = np.exp(vals - np.max(vals)); probs = exp / (exp.sum() + 1e-9)
-    return {k: float(p) for k, p in zip(scores.keys(), probs)}
+    scores = np.stack([surprise, happy, angry, sad, neutral], axis=1)
+    exp = np.exp(scores - scores.max(axis=1, keepdims=True))
+    return exp / (exp.sum(axis=1, keepdims=True) + 1e-9)
+
+def classify_emotion_from_landmarks(landmarks: np.ndarray) -> Dict[str, float]:
+    probs = classify_emotions_batch(np.asarray(landmarks)[None])[0]
+    return {k: float(p) for k, p in zip(EMOTIONS, probs)}
 
 def decode_image(file_bytes: bytes) -> np.ndarray:
     img = Image.open(BytesIO(file_bytes)).convert("RGB")
     return np.array(img)
 
+def decode_for_inference(file_bytes: bytes, max_side: int = INFER_MAX_SIDE) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Decode straight to inference resolution; returns the frame and the original (width, height)."""
+    img = Image.open(BytesIO(file_bytes))
+    orig_size = img.size
+    if max_side > 0 and max(orig_size) > max_side:
+        # JPEG only: lets libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full resolution
+        img.draft("RGB", (max_side, max_side))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if max_side > 0 and max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.BILINEAR)
+    # PIL's array interface goes through tobytes(), so this is one copy; np.array would add a second
+    return np.asarray(img), orig_size
+
+async def read_upload(image: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    # the form is already spooled (and capped by BoundedUploadRoute); read at most one byte past the limit
+    if image.size is not None and image.size > max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Image exceeds {max_bytes} bytes.")
+    data = await image.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Image exceeds {max_bytes} bytes.")
+    return data
+
+def faces_from_mesh(multi_face_landmarks, w: int, h: int) -> List[Dict[str, Any]]:
+    return faces_from_points(landmarks_to_array(multi_face_landmarks), w, h)
+
+def faces_from_points(pts: np.ndarray, w: int, h: int) -> List[Dict[str, Any]]:
+    if not len(pts):
+        return []
+    probs = classify_emotions_batch(pts)
+    top = probs.argmax(axis=1)
+    xs = pts[:, :, 0] * w; ys = pts[:, :, 1] * h
+    x1s, y1s, x2s, y2s = xs.min(axis=1), ys.min(axis=1), xs.max(axis=1), ys.max(axis=1)
+    results_payload: List[Dict[str, Any]] = []
+    for i in range(len(pts)):
+        x1, y1, x2, y2 = int(x1s[i]), int(y1s[i]), int(x2s[i]), int(y2s[i])
+        bbox = {"x": x1, "y": y1, "width": int(x2 - x1), "height": int(y2 - y1)}
+        results_payload.append({ "bbox": bbox, "top_emotion": EMOTIONS[top[i]], "probabilities": {k: float(p) for k, p in zip(EMOTIONS, probs[i])} })
+    return results_payload
+
+def _neutral_face(b, w: int, h: int) -> Dict[str, Any]:
+    bbox = { "x": int(b.xmin * w), "y": int(b.ymin * h), "width": int(b.width * w), "height": int(b.height * h) }
+    return { "bbox": bbox, "top_emotion": "Neutral", "probabilities": {"Neutral": 1.0} }
+
+def _detect_full(frame_rgb: np.ndarray, w: int, h: int, timings: Dict[str, float]) -> List[Dict[str, Any]]:
+    with mesh_pool.checkout() as (face_mesh, waited):
+        timings["pool_wait_ms"] += 1000 * waited
+        t0 = time.perf_counter()
+        mesh = face_mesh.process(frame_rgb)
+        timings["mesh_ms"] += 1000 * (time.perf_counter() - t0)
+    if mesh.multi_face_landmarks:
+        return faces_from_mesh(mesh.multi_face_landmarks, w, h)
+    with detection_pool.checkout() as (fd, waited):
+        timings["pool_wait_ms"] += 1000 * waited
+        t0 = time.perf_counter()
+        det = fd.process(frame_rgb)
+        timings["detection_ms"] += 1000 * (time.perf_counter() - t0)
+    return [_neutral_face(d.location_data.relative_bounding_box, w, h) for d in det.detections or []]
+
+def _detect_cascade(frame_rgb: np.ndarray, w: int, h: int, timings: Dict[str, float]) -> List[Dict[str, Any]]:
+    fh, fw = frame_rgb.shape[:2]
+    with detection_pool.checkout() as (fd, waited):
+        timings["pool_wait_ms"] += 1000 * waited
+        t0 = time.perf_counter()
+        det = fd.process(frame_rgb)
+        timings["detection_ms"] += 1000 * (time.perf_counter() - t0)
+    boxes = [d.location_data.relative_bounding_box for d in det.detections or []]
+    timings["crops"] = len(boxes)
+    if not boxes:
+        return []
+
+    crops: List[Optional[Tuple[int, int, int, int]]] = []  # None: too small to run the mesh on
+    for b in boxes:
+        pad_x, pad_y = b.width * CASCADE_PAD, b.height * CASCADE_PAD
+        x1 = max(0, int((b.xmin - pad_x) * fw)); y1 = max(0, int((b.ymin - pad_y) * fh))
+        x2 = min(fw, int(np.ceil((b.xmin + b.width + pad_x) * fw))); y2 = min(fh, int(np.ceil((b.ymin + b.height + pad_y) * fh)))
+        crops.append((x1, y1, x2, y2) if x2 - x1 >= 8 and y2 - y1 >= 8 else None)
+
+    meshes: List[Any] = [None] * len(crops)
+    todo = [i for i, c in enumerate(crops) if c is not None]
+    if todo:
+        with mesh_pool.checkout() as (face_mesh, waited):
+            timings["pool_wait_ms"] += 1000 * waited
+            t0 = time.perf_counter()
+            for i in todo:
+                x1, y1, x2, y2 = crops[i]
+                meshes[i] = face_mesh.process(np.ascontiguousarray(frame_rgb[y1:y2, x1:x2]))
+            timings["mesh_ms"] += 1000 * (time.perf_counter() - t0)
+
+    points: List[np.ndarray] = []
+    fallback: List[Dict[str, Any]] = []
+    for b, crop, mesh in zip(boxes, crops, meshes):
+        if mesh is None or not mesh.multi_face_landmarks:
+            fallback.append(_neutral_face(b, w, h)); continue
+        # crop-normalized -> frame-normalized
+        x1, y1, x2, y2 = crop
+        pts = landmarks_to_array(mesh.multi_face_landmarks[:1])[0]
+        cw, ch = x2 - x1, y2 - y1
+        pts[:, 0] = (x1 + pts[:, 0] * cw) / fw
+        pts[:, 1] = (y1 + pts[:, 1] * ch) / fh
+        pts[:, 2] *= cw / fw
+        points.append(pts)
+    faces = faces_from_points(np.stack(points), w, h) if points else []
+    return faces + fallback
+
+def detect_faces(frame_rgb: np.ndarray, orig_size: Optional[Tuple[int, int]] = None, mode: str = DETECT_MODE) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+    # MediaPipe reports normalized coordinates, so scaling by the original size maps boxes back to the upload
+    w, h = orig_size or (frame_rgb.shape[1], frame_rgb.shape[0])
+    timings = {"pool_wait_ms": 0.0, "detection_ms": 0.0, "mesh_ms": 0.0}
+    if mode == "cascade":
+        results_payload = _detect_cascade(frame_rgb, w, h, timings)
+    else:
+        results_payload = _detect_full(frame_rgb, w, h, timings)
+    timings["inference_ms"] = timings["detection_ms"] + timings["mesh_ms"]
+    return results_payload, {k: round(v, 3) for k, v in timings.items()}
+
+def record_history(source: str, faces: List[Dict[str, Any]]) -> Dict[str, int]:
+    emotions = [r["top_emotion"] for r in faces]
+    if emotions:
+        if source != GLOBAL_SOURCE:
+            history_engine.record(source, emotions)
+        history_engine.record(GLOBAL_SOURCE, emotions)
+    return history_engine.counts(source, HISTORY_DEFAULT_WINDOW)
+
+def detect_image_bytes(file_bytes: bytes, mode: str = DETECT_MODE) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    key = content_key(file_bytes, mode) if CACHE_ENABLED else None
+    if key is not None:
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached, {"cache": "hit"}
+
+    t0 = time.perf_counter()
+    frame_rgb, orig_size = decode_for_inference(file_bytes)
+    decode_ms = 1000 * (time.perf_counter() - t0)
+    phash, group = None, (mode, orig_size)
+    if key is not None and CACHE_PHASH:
+        phash = perceptual_hash(frame_rgb)
+        cached = result_cache.get_similar(phash, group)
+        if cached is not None:
+            result_cache.put(key, cached, phash, group)
+            return cached, {"cache": "phash_hit", "decode_ms": round(decode_ms, 3)}
+
+    faces, timings = detect_faces(frame_rgb, orig_size, mode)
+    timings["decode_ms"] = round(decode_ms, 3)
+    if key is not None:
+        result_cache.miss()
+        result_cache.put(key, faces, phash, group)
+        timings["cache"] = "miss"
+    return faces, timings
+
 @router.post("/detect")
-async def detect_emotion(image: UploadFile = File(...), _: Account = Depends(get_current_account)) -> Any:
+async def detect_emotion(image: UploadFile = File(...), mode: str = Query(DETECT_MODE, pattern="^(full|cascade)$"), source: Optional[str] = Query(None, max_length=64), account: Account = Depends(get_current_account)) -> Any:
     if not image.content_type.startswith("image/"):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Please upload an image file.")
-    file_bytes = await image.read()
-    frame_rgb = decode_image(file_bytes)
-    h, w, _ = frame_rgb.shape
+    file_bytes = await read_upload(image)
+    try:
+        results_payload, timings = await run_in_threadpool(detect_image_bytes, file_bytes, mode)
+    except PoolTimeout as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
 
-    results_payload: List[Dict[str, Any]] = []
-    with mp_face_mesh.FaceMesh(static_image_mode=True, max_num_faces=5, refine_landmarks=True, min_detection_confidence=0.5) as face_mesh:
-        mesh = face_mesh.process(frame_rgb)
-        if not mesh.multi_face_landmarks:
-            with mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5) as fd:
-                det = fd.process(frame_rgb)
-                if det.detections:
-                    for d in det.detections:
-                        b = d.location_data.relative_bounding_box
-                        bbox = { "x": int(b.xmin * w), "y": int(b.ymin * h), "width": int(b.width * w), "height": int(b.height * h) }
-                        results_payload.append({ "bbox": bbox, "top_emotion": "Neutral", "probabilities": {"Neutral": 1.0} })
-        else:
-            for face_landmarks in mesh.multi_face_landmarks:
-                pts = np.array([(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark], dtype=np.float32)
-                probs = classify_emotion_from_landmarks(pts)
-                top_emotion = max(probs, key=probs.get)
-                xs = pts[:,0] * w; ys = pts[:,1] * h
-                x1, y1, x2, y2 = int(xs.min()), int(ys.min()), int(xs.max()), int(ys.max())
-                bbox = {"x": x1, "y": y1, "width": int(x2 - x1), "height": int(y2 - y1)}
-                results_payload.append({ "bbox": bbox, "top_emotion": top_emotion, "probabilities": probs })
-
-    for r in results_payload: history.append(r["top_emotion"])
-    agg = {}; [agg.__setitem__(e, agg.get(e,0)+1) for e in history]
-    return JSONResponse({"faces": results_payload, "history": agg})
+    agg = await run_in_threadpool(record_history, source or account.username, results_payload)
+    return JSONResponse({"faces": results_payload, "history": agg, "timings": timings})
+
+def _submit_detections(payloads: List[bytes], mode: str):
+    loop = asyncio.get_running_loop()
+    for _ in range(2):
+        pool = get_process_pool()
+        futures = []
+        try:
+            for b in payloads:
+                futures.append(loop.run_in_executor(pool, detect_image_bytes, b, mode))
+            return pool, futures
+        except BrokenProcessPool:
+            # a worker died (OOM, crash on a bad frame) after an earlier batch: replace the pool and retry once
+            for f in futures:
+                f.cancel()
+            reset_process_pool(pool)
+    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Detection workers unavailable, please retry.")
+
+@router.post("/detect_batch")
+async def detect_emotion_batch(images: List[UploadFile] = File(...), mode: str = Query(DETECT_MODE, pattern="^(full|cascade)$"), source: Optional[str] = Query(None, max_length=64), account: Account = Depends(get_current_account)) -> Any:
+    if len(images) > BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"At most {BATCH_MAX_IMAGES} images per batch.")
+    for image in images:
+        if not (image.content_type or "").startswith("image/"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{image.filename or 'upload'} is not an image file.")
+    payloads = [await read_upload(image) for image in images]
+
+    pool, futures = _submit_detections(payloads, mode)
+    outcomes = await asyncio.gather(*futures, return_exceptions=True)
+    if any(isinstance(o, BrokenProcessPool) for o in outcomes):
+        # a worker died during this batch; later batches get a fresh pool instead of failing on submit
+        reset_process_pool(pool)
+
+    results: List[Dict[str, Any]] = []
+    for i, outcome in enumerate(outcomes):
+        if isinstance(outcome, BaseException):
+            results.append({"index": i, "faces": [], "error": str(outcome) or outcome.__class__.__name__})
+            continue
+        faces, timings = outcome
+        results.append({"index": i, "faces": faces, "timings": timings})
+    all_faces = [f for r in results for f in r["faces"]]
+    agg = await run_in_threadpool(record_history, source or account.username, all_faces)
+    return JSONResponse({"results": results, "history": agg})
+
+class StreamSession:
+    """Per-connection tracker: FaceMesh in tracking mode between keyframes, pooled full detection on keyframes."""
+
+    def __init__(self, keyframe_interval: int = STREAM_KEYFRAME_INTERVAL, max_num_faces: int = STREAM_MAX_FACES):
+        self.tracker = new_tracking_mesh(max_num_faces)
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.frames = 0
+        self.since_keyframe = 0
+        self.force_keyframe = True
+        self.tracking = False
+
+    def process(self, file_bytes: bytes) -> Dict[str, Any]:
+        self.frames += 1
+        t0 = time.perf_counter()
+        frame_rgb, (w, h) = decode_for_inference(file_bytes)
+        decode_ms = 1000 * (time.perf_counter() - t0)
+
+        keyframe = self.force_keyframe or self.since_keyframe >= self.keyframe_interval
+        if not keyframe:
+            t0 = time.perf_counter()
+            mesh = self.tracker.process(frame_rgb)
+            track_ms = 1000 * (time.perf_counter() - t0)
+            # the tracker re-runs its own detector while it holds no track, so an empty result only
+            # warrants a full detection when it had faces before (tracking lost)
+            if mesh.multi_face_landmarks or not self.tracking:
+                self.since_keyframe += 1
+                self.tracking = bool(mesh.multi_face_landmarks)
+                faces = faces_from_mesh(mesh.multi_face_landmarks or [], w, h)
+                return {"frame": self.frames, "keyframe": False, "faces": faces,
+                        "timings": {"decode_ms": round(decode_ms, 3), "tracking_ms": round(track_ms, 3)}}
+
+        faces, timings = detect_faces(frame_rgb, (w, h))
+        timings["decode_ms"] = round(decode_ms, 3)
+        self.force_keyframe = False
+        self.since_keyframe = 0
+        self.tracking = bool(faces)
+        return {"frame": self.frames, "keyframe": True, "faces": faces, "timings": timings}
+
+    def close(self) -> None:
+        self.tracker.close()
+
+@router.websocket("/stream")
+async def stream_emotion(websocket: WebSocket, token: str = Query(...), source: Optional[str] = Query(None, max_length=64)):
+    db = SessionLocal()
+    try:
+        account = account_from_token(db, token)
+    finally:
+        db.close()
+    if account is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+
+    session = await run_in_threadpool(StreamSession)
+    # only the newest frame is kept; frames that arrive while one is being processed are dropped
+    latest: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    def offer(item) -> None:
+        if latest.full():
+            latest.get_nowait()
+        latest.put_nowait(item)
+
+    async def reader():
+        try:
+            while True:
+                msg = await websocket.receive()
+                if msg["type"] == "websocket.disconnect":
+                    break
+                if msg.get("text") == "keyframe":
+                    session.force_keyframe = True
+                elif msg.get("bytes"):
+                    offer(msg["bytes"])
+        finally:
+            offer(None)
+
+    reader_task = asyncio.create_task(reader())
+    try:
+        while (data := await latest.get()) is not None:
+            try:
+                if len(data) > MAX_UPLOAD_BYTES:
+                    result = {"frame": session.frames, "error": f"Frame exceeds {MAX_UPLOAD_BYTES} bytes."}
+                else:
+                    result = await run_in_threadpool(session.process, data)
+            except PoolTimeout as e:
+                result = {"frame": session.frames, "error": str(e)}
+            except (OSError, Image.DecompressionBombError):
+                # PIL: not an image, truncated, or too many pixels (UnidentifiedImageError is an OSError)
+                result = {"frame": session.frames, "error": "Could not decode frame."}
+            except Exception as e:
+                traceback.print_exc()
+                result = {"frame": session.frames, "error": f"Internal error processing frame: {e.__class__.__name__}"}
+            if result.get("keyframe"):
+                await run_in_threadpool(record_history, source or account.username, result["faces"])
+            await websocket.send_json(result)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        reader_task.cancel()
+        await run_in_threadpool(session.close)
 
 @router.get("/history")
-def get_history(_: Account = Depends(get_current_account)):
-    agg = {}; [agg.__setitem__(e, agg.get(e,0)+1) for e in history]
-    return {"history": agg, "size": len(history)}
+def get_history(
+    window: str = Query(HISTORY_DEFAULT_WINDOW, pattern="^(1m|15m|1h)$"),
+    source: Optional[str] = Query(None, max_length=64, description="Camera id, '*' for all sources; defaults to the caller"),
+    account: Account = Depends(get_current_account),
+):
+    key = source or account.username
+    agg = history_engine.counts(key, window)
+    return {"history": agg, "size": sum(agg.values()), "window": window, "source": key}
+
+def warm_up() -> Dict[str, Any]:
+    """Import the vision stack and build the detector graphs now rather than on the first request."""
+    load_all()
+    detectors.warm_up()
+    return lazy_report()
+
+@router.post("/warmup")
+async def post_warmup(_: Account = Depends(get_current_account)):
+    return await run_in_threadpool(warm_up)
+
+@router.get("/pool")
+def get_pool(_: Account = Depends(get_current_account)):
+    return pool_stats()
+
+@router.get("/cache")
+def get_cache(_: Account = Depends(get_current_account)):
+    return result_cache.stats()
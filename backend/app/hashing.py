@@ -0,0 +1,94 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from fastapi import HTTPException, status
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "64"))
+
+
+class PasswordHashExecutor:
+    """bcrypt runs here instead of the shared request threadpool; excess load is rejected, not queued forever."""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_QUEUE):
+        self.workers = max(1, workers)
+        self.max_pending = max(0, max_pending)
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.wait_total = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many login attempts in progress, please retry", headers={"Retry-After": "1"})
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            with self._lock:
+                self.in_flight += 1
+            try:
+                return fn(*args)
+            finally:
+                done = time.perf_counter()
+                with self._lock:
+                    self.in_flight -= 1
+                    self.completed += 1
+                    self.wait_total += started - submitted
+                    self.run_total += done - started
+                    self.run_max = max(self.run_max, done - started)
+
+        try:
+            future = self._pool().submit(job)
+        except BaseException:
+            self._slots.release()
+            raise
+        # the slot follows the job, not the caller: a disconnected client must not free it while bcrypt still runs
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+    async def verify(self, context, plain: str, hashed: str) -> bool:
+        return await self.run(context.verify, plain, hashed)
+
+    async def hash(self, context, plain: str) -> str:
+        return await self.run(context.hash, plain)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self.completed
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "completed": n,
+                "rejected": self.rejected,
+                "queue_wait_avg_ms": round(1000 * self.wait_total / n, 3) if n else 0.0,
+                "hash_avg_ms": round(1000 * self.run_total / n, 3) if n else 0.0,
+                "hash_max_ms": round(1000 * self.run_max, 3),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+password_hasher = PasswordHashExecutor()
@@ -0,0 +1,167 @@
+import os
+import time
+import sqlite3
+import pathlib
+import threading
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+HISTORY_WINDOWS = {"1m": 60, "15m": 15 * 60, "1h": 60 * 60}
+HISTORY_DEFAULT_WINDOW = os.getenv("EMOTION_HISTORY_WINDOW", "15m")
+HISTORY_BUCKET_SECONDS = int(os.getenv("EMOTION_HISTORY_BUCKET_SECONDS", "10"))
+HISTORY_STORE = os.getenv("EMOTION_HISTORY_STORE", "memory")
+GLOBAL_SOURCE = "*"
+
+_LONGEST = max(HISTORY_WINDOWS.values())
+
+
+def _bucket(now: Optional[float]) -> int:
+    return int((time.time() if now is None else now) // HISTORY_BUCKET_SECONDS)
+
+
+def _span(window: str) -> int:
+    return max(1, HISTORY_WINDOWS[window] // HISTORY_BUCKET_SECONDS)
+
+
+class _SourceCounters:
+    """Time buckets for one source plus a running total per window.
+
+    Each bucket is subtracted from a window's total exactly once, when it slides out,
+    so updates and reads are amortized O(1).
+    """
+
+    def __init__(self):
+        self.buckets: deque = deque()  # (bucket_id, {emotion: count}), oldest first
+        self.expired = {w: 0 for w in HISTORY_WINDOWS}  # leading buckets already out of each window
+        self.totals: Dict[str, Dict[str, int]] = {w: {} for w in HISTORY_WINDOWS}
+
+    def advance(self, now_bucket: int) -> None:
+        for w, span in ((w, _span(w)) for w in HISTORY_WINDOWS):
+            i = self.expired[w]
+            total = self.totals[w]
+            while i < len(self.buckets) and self.buckets[i][0] <= now_bucket - span:
+                for e, n in self.buckets[i][1].items():
+                    left = total[e] - n
+                    if left: total[e] = left
+                    else: del total[e]
+                i += 1
+            self.expired[w] = i
+        # drop buckets every window is done with
+        drop = min(self.expired.values())
+        for _ in range(drop):
+            self.buckets.popleft()
+        if drop:
+            for w in self.expired:
+                self.expired[w] -= drop
+
+    def add(self, now_bucket: int, emotion: str, n: int = 1) -> None:
+        self.advance(now_bucket)
+        if not self.buckets or self.buckets[-1][0] != now_bucket:
+            self.buckets.append((now_bucket, {}))
+        counts = self.buckets[-1][1]
+        counts[emotion] = counts.get(emotion, 0) + n
+        for total in self.totals.values():
+            total[emotion] = total.get(emotion, 0) + n
+
+
+class MemoryHistory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources: Dict[str, _SourceCounters] = {}
+        self._swept = 0
+
+    def _sweep(self, now_bucket: int) -> None:
+        # once per bucket: forget sources with nothing left in any window, so ad-hoc ?source= values don't pile up
+        if now_bucket == self._swept:
+            return
+        self._swept = now_bucket
+        for source in list(self._sources):
+            counters = self._sources[source]
+            counters.advance(now_bucket)
+            if not counters.buckets:
+                del self._sources[source]
+
+    def record(self, source: str, emotions: Iterable[str], now: Optional[float] = None) -> None:
+        b = _bucket(now)
+        with self._lock:
+            self._sweep(b)
+            counters = self._sources.get(source)
+            if counters is None:
+                counters = self._sources[source] = _SourceCounters()
+            for e in emotions:
+                counters.add(b, e)
+
+    def counts(self, source: str, window: str = HISTORY_DEFAULT_WINDOW, now: Optional[float] = None) -> Dict[str, int]:
+        with self._lock:
+            counters = self._sources.get(source)
+            if counters is None:
+                return {}
+            counters.advance(_bucket(now))
+            return dict(counters.totals[window])
+
+
+class SQLiteHistory:
+    """Same interface, backed by a local SQLite file so every uvicorn worker sees the same counts."""
+
+    PRUNE_EVERY = 500
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        con = self._conn()
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS emotion_history(
+            source TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            emotion TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY(source, bucket, emotion)
+        ) WITHOUT ROWID""")
+        con.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def record(self, source: str, emotions: Iterable[str], now: Optional[float] = None) -> None:
+        b = _bucket(now)
+        agg: Dict[str, int] = {}
+        for e in emotions:
+            agg[e] = agg.get(e, 0) + 1
+        if not agg:
+            return
+        con = self._conn()
+        with con:
+            con.executemany(
+                "INSERT INTO emotion_history(source, bucket, emotion, count) VALUES(?,?,?,?) "
+                "ON CONFLICT(source, bucket, emotion) DO UPDATE SET count = count + excluded.count",
+                [(source, b, e, n) for e, n in agg.items()],
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                con.execute("DELETE FROM emotion_history WHERE bucket <= ?", (b - _LONGEST // HISTORY_BUCKET_SECONDS,))
+
+    def counts(self, source: str, window: str = HISTORY_DEFAULT_WINDOW, now: Optional[float] = None) -> Dict[str, int]:
+        b = _bucket(now)
+        rows = self._conn().execute(
+            "SELECT emotion, SUM(count) FROM emotion_history WHERE source=? AND bucket>? GROUP BY emotion",
+            (source, b - _span(window)),
+        ).fetchall()
+        return {e: int(n) for e, n in rows}
+
+
+def _make_engine():
+    if HISTORY_STORE == "sqlite":
+        db_dir = pathlib.Path(os.getenv("DB_DIR", "backend/data"))
+        db_dir.mkdir(parents=True, exist_ok=True)
+        return SQLiteHistory(db_dir / "emotion_history.sqlite")
+    return MemoryHistory()
+
+
+history_engine = _make_engine()
@@ -0,0 +1,56 @@
+import importlib
+import threading
+import time
+from types import ModuleType
+from typing import Any, Dict, List
+
+_lock = threading.Lock()
+_proxies: List["LazyModule"] = []
+_load_seconds: Dict[str, float] = {}
+
+
+class LazyModule:
+    """Stands in for a heavy module and imports it on first attribute access.
+
+    Keeps `cv2.resize(...)`-style call sites unchanged while the import cost moves
+    from worker start to the first request (or an explicit warm-up) that needs it."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        with _lock:
+            _proxies.append(self)
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            with _lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    _load_seconds[self._name] = time.perf_counter() - started
+                    self._module = module
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name!r} ({'loaded' if self.loaded else 'not loaded'})>"
+
+
+def load_all() -> None:
+    for proxy in list(_proxies):
+        proxy.load()
+
+
+def lazy_report() -> Dict[str, Any]:
+    with _lock:
+        names = sorted({p._name for p in _proxies})
+        return {
+            "loaded_ms": {n: round(1000 * s, 1) for n, s in _load_seconds.items()},
+            "pending": [n for n in names if n not in _load_seconds],
+        }
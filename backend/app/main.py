@@ -1,55 +1,299 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
 import os
-from fastapi import FastAPI, Depends, HTTPException, status
+import json
+import base64
+from fastapi import FastAPI, Depends, HTTPException, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from fastapi import Body
+from bisect import bisect_left, bisect_right
 from datetime import datetime, timedelta
-from .database import Base, engine, get_db
+from .database import get_db, SessionLocal
 from .models import Account, Person, Attendance
-from .schemas import LoginRequest, TokenResponse, UserCreate, UserOut, AttendanceOut
-from .auth import verify_password, create_access_token, get_current_account
-from .seed import seed
+from .schemas import LoginRequest, TokenResponse, UserCreate, UserOut, AttendanceOut, BulkMarkRequest
+from .auth import pwd_context, create_access_token, get_current_account
+from .hashing import password_hasher
+from .rollups import bump_rollup
+from .sessions import apply_event, add_point_sessions
+from .bootstrap import init_db
+from .lazy import lazy_report
+from .timeutil import naive_utc
+from .person_cache import person_cache
+from .dedup_index import dedup_index, warm_from_db, DEDUP_WINDOW_MINUTES, DEDUP_INDEX_AUTHORITATIVE
 from . import emotion
 from . import dashboard 
+from . import detectors
+from ..routers import settings as settings_router
+from ..routers import reports as reports_router
+from ..routers import calendar as calendar_router
+from ..routers import auth as auth_router
+from ..integrations.alerts import webhook_dispatcher, alert_coalescer
 
 
-DEDUP_WINDOW_MINUTES = 2
+ATTENDANCE_PAGE_MAX = 1000
+ATTENDANCE_EXPORT_BATCH = 1000
+SQL_IN_CHUNK = 500
 
 load_dotenv()
-Base.metadata.create_all(bind=engine)
-with next(get_db()) as db:
-    seed(db)
+# schema + seed is a one-shot step (python -m backend.app.bootstrap); set this to 0 once that runs at deploy
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "1") == "1"
+# the vision stack is imported lazily; 1 loads it and builds detectors before serving
+DETECTOR_WARMUP = os.getenv("DETECTOR_WARMUP", "0") == "1"
 
 app = FastAPI(title="FaceSense API", version="1.0.0")
 
 origins = [o.strip() for o in os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",") if o.strip()]
-app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Next-Cursor"])
 
 app.include_router(emotion.router)
 app.include_router(dashboard.router)
+app.include_router(settings_router.router)
+app.include_router(reports_router.router)
+app.include_router(calendar_router.router)
+app.include_router(auth_router.router)
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+DB_INIT_SECONDS = None
+
+@app.on_event("startup")
+def init_database():
+    global DB_INIT_SECONDS
+    if DB_INIT_ON_STARTUP:
+        DB_INIT_SECONDS = init_db()
+    print(f"Startup: main imported in {IMPORT_SECONDS:.2f}s"
+          + (f", database initialised in {DB_INIT_SECONDS:.2f}s" if DB_INIT_SECONDS is not None else "")
+          + f", vision stack {'warming up' if DETECTOR_WARMUP else 'deferred to first use'}")
+
+@app.on_event("startup")
+def warm_detectors():
+    if DETECTOR_WARMUP:
+        emotion.warm_up()
+
+@app.on_event("startup")
+def warm_dedup_index():
+    with next(get_db()) as db:
+        warm_from_db(dedup_index, db)
+
+@app.on_event("startup")
+async def start_webhook_dispatcher():
+    await webhook_dispatcher.start()
+
+@app.on_event("shutdown")
+async def stop_webhook_dispatcher():
+    alert_coalescer.flush_all()  # pending digests go out before the workers drain
+    await webhook_dispatcher.stop()
+
+@app.on_event("shutdown")
+def close_detectors():
+    detectors.mesh_pool.close()
+    detectors.detection_pool.close()
+    detectors.shutdown_process_pool()
+
+@app.on_event("shutdown")
+def close_password_hasher():
+    password_hasher.shutdown()
 
 @app.post("/api/login", response_model=TokenResponse, tags=["auth"])
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    account = db.query(Account).filter(Account.username == payload.username).first()
-    if not account or not verify_password(payload.password, account.password_hash):
+async def login(payload: LoginRequest, db: Session = Depends(get_db)):
+    account = await run_in_threadpool(lambda: db.query(Account).filter(Account.username == payload.username).first())
+    if not account or not await password_hasher.verify(pwd_context, payload.password, account.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
     token = create_access_token({"sub": account.username})
     return {"token": token}
 
+@app.get("/api/metrics/password_hashing", tags=["auth"])
+def password_hashing_metrics(_: Account = Depends(get_current_account)):
+    return password_hasher.stats()
+
+@app.get("/api/metrics/startup", tags=["auth"])
+def startup_metrics(_: Account = Depends(get_current_account)):
+    return {
+        "main_import_ms": round(1000 * IMPORT_SECONDS, 1),
+        "db_init_ms": round(1000 * DB_INIT_SECONDS, 1) if DB_INIT_SECONDS is not None else None,
+        "lazy_modules": lazy_report(),
+    }
+
+@app.get("/api/metrics/alerts", tags=["integrations"])
+async def alert_metrics(_: Account = Depends(get_current_account)):
+    # async so it runs on the event loop: the coalescer's buffers are only safe to read from there
+    return {**webhook_dispatcher.stats(), "digest": alert_coalescer.stats()}
+
 @app.get("/api/users/recent", response_model=List[UserOut], tags=["users"])
 def get_recent_users(db: Session = Depends(get_db), _: Account = Depends(get_current_account)):
     return db.query(Person).order_by(Person.id.desc()).limit(10).all()
 
 @app.post("/api/users", response_model=UserOut, tags=["users"])
 def add_user(payload: UserCreate, db: Session = Depends(get_db), _: Account = Depends(get_current_account)):
-    p = Person(name=payload.name); db.add(p); db.commit(); db.refresh(p); return p
+    p = Person(name=payload.name); db.add(p)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A user with this name already exists")
+    db.refresh(p)
+    person_cache.put(p.name, p.id)
+    return p
+
+def _encode_cursor(ts: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{ts.isoformat()}|{row_id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        ts, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def _attendance_page(db: Session, after, limit: int, date_from: Optional[datetime], date_to: Optional[datetime], person_id: Optional[int]):
+    # newest first, keyset on (timestamp, id) so every page is an index range scan
+    q = db.query(Attendance.id, Person.name, Attendance.emotion, Attendance.timestamp).join(Person, Attendance.person_id == Person.id)
+    if date_from is not None: q = q.filter(Attendance.timestamp >= date_from)
+    if date_to is not None: q = q.filter(Attendance.timestamp <= date_to)
+    if person_id is not None: q = q.filter(Attendance.person_id == person_id)
+    if after is not None:
+        ts, row_id = after
+        q = q.filter(or_(Attendance.timestamp < ts, and_(Attendance.timestamp == ts, Attendance.id < row_id)))
+    return q.order_by(Attendance.timestamp.desc(), Attendance.id.desc()).limit(limit).all()
+
+def _export_attendance(fmt: str, after, date_from, date_to, person_id):
+    # own session: the request-scoped one is closed before the body is streamed
+    db = SessionLocal()
+    try:
+        first = True
+        if fmt == "json": yield "["
+        while True:
+            rows = _attendance_page(db, after, ATTENDANCE_EXPORT_BATCH, date_from, date_to, person_id)
+            for r in rows:
+                line = json.dumps({"id": r.id, "name": r.name, "emotion": r.emotion, "timestamp": r.timestamp.isoformat()})
+                if fmt == "json":
+                    yield line if first else "," + line
+                else:
+                    yield line + "\n"
+                first = False
+            if len(rows) < ATTENDANCE_EXPORT_BATCH:
+                break
+            after = (rows[-1].timestamp, rows[-1].id)
+        if fmt == "json": yield "]"
+    finally:
+        db.close()
 
 @app.get("/api/attendance", response_model=List[AttendanceOut], tags=["attendance"])
-def get_attendance(db: Session = Depends(get_db), _: Account = Depends(get_current_account)):
-    rows = db.query(Attendance).join(Person, Attendance.person_id == Person.id).order_by(Attendance.timestamp.desc()).all()
-    return [AttendanceOut(id=r.id, name=r.person.name, emotion=r.emotion, timestamp=r.timestamp) for r in rows]
+def get_attendance(
+    response: Response,
+    limit: int = Query(100, ge=1, le=ATTENDANCE_PAGE_MAX),
+    cursor: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    person_id: Optional[int] = None,
+    export: Optional[str] = Query(None, pattern="^(ndjson|json)$", description="Stream every matching row instead of one page"),
+    db: Session = Depends(get_db),
+    _: Account = Depends(get_current_account),
+):
+    after = _decode_cursor(cursor) if cursor else None
+    # stored timestamps are naive UTC; an offset in the query must not shift the range
+    date_from = naive_utc(date_from) if date_from is not None else None
+    date_to = naive_utc(date_to) if date_to is not None else None
+    if export:
+        media_type = "application/x-ndjson" if export == "ndjson" else "application/json"
+        return StreamingResponse(_export_attendance(export, after, date_from, date_to, person_id), media_type=media_type)
+    rows = _attendance_page(db, after, limit, date_from, date_to, person_id)
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].timestamp, rows[-1].id)
+    return [AttendanceOut(id=r.id, name=r.name, emotion=r.emotion, timestamp=r.timestamp) for r in rows]
+
+def _chunks(items: list, n: int = SQL_IN_CHUNK):
+    for i in range(0, len(items), n): yield items[i:i + n]
+
+def _resolve_person_ids(db: Session, names: List[str]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """name -> id for every name, creating missing persons in the current transaction.
+
+    Returns (all ids, ids created here); the created ones must only be cached after commit.
+    """
+    ids: Dict[str, int] = {}
+    misses = []
+    for name in names:
+        pid = person_cache.get(name)
+        if pid is None: misses.append(name)
+        else: ids[name] = pid
+    for _ in range(3):
+        found = []
+        for chunk in _chunks([n for n in misses if n not in ids]):
+            found += db.query(Person.name, Person.id).filter(Person.name.in_(chunk)).all()
+        ids.update(found)
+        person_cache.put_many(found)
+        missing = [n for n in misses if n not in ids]
+        if not missing:
+            return ids, {}
+        created = [Person(name=n) for n in missing]
+        db.add_all(created)
+        try:
+            db.flush()
+        except IntegrityError:
+            # a concurrent request created some of these names first; re-read and retry
+            db.rollback()
+            continue
+        created_ids = {p.name: p.id for p in created}
+        ids.update(created_ids)
+        return ids, created_ids
+    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Could not resolve persons, please retry")
+
+def _resolve_person_id(db: Session, name: str) -> int:
+    ids, created = _resolve_person_ids(db, [name])
+    if created:
+        db.commit()
+        person_cache.put_many(created.items())
+    return ids[name]
+
+def _mark_result(name: str, row_id: int, emotion: str, ts: datetime, deduped: bool) -> dict:
+    return {
+        "ok": True,
+        "id": row_id,
+        "name": name,
+        "emotion": emotion,
+        "timestamp": ts.isoformat(),
+        "deduped": deduped,
+    }
+
+def _record_mark(db: Session, person_id: int, name: str, emotion: str) -> dict:
+    now = datetime.utcnow()
+    key = (person_id, emotion)
+    hit = dedup_index.lookup(key, now)
+    if hit:
+        return _mark_result(name, hit[1], emotion, hit[0], True)
+
+    if not DEDUP_INDEX_AUTHORITATIVE:
+        # another worker may have written the mark; the index only knows this process's writes
+        since = now - timedelta(minutes=DEDUP_WINDOW_MINUTES)
+        existing = (
+            db.query(Attendance.id, Attendance.timestamp)
+            .filter(
+                Attendance.person_id == person_id,
+                Attendance.timestamp >= since,
+                Attendance.emotion == emotion,
+            )
+            .order_by(Attendance.timestamp.desc())
+            .first()
+        )
+        if existing:
+            dedup_index.record_mark(person_id, emotion, existing.timestamp, existing.id)
+            return _mark_result(name, existing.id, emotion, existing.timestamp, True)
+
+    a = Attendance(person_id=person_id, emotion=emotion, timestamp=now)
+    db.add(a)
+    bump_rollup(db, person_id, emotion, a.timestamp)
+    apply_event(db, person_id, name, "attendance", a.timestamp)
+    db.flush()
+    result = _mark_result(name, a.id, emotion, a.timestamp, False)
+    db.commit()
+    dedup_index.record_mark(person_id, emotion, a.timestamp, a.id)
+    return result
 
 @app.post("/api/attendance/mark", tags=["attendance"])
 def mark_attendance(
@@ -58,46 +302,7 @@ def mark_attendance(
     db: Session = Depends(get_db),
     _: Account = Depends(get_current_account),
 ):
-    person = db.query(Person).filter(Person.name == name).first()
-    if not person:
-        person = Person(name=name)
-        db.add(person)
-        db.commit()
-        db.refresh(person)
-
-    since = datetime.utcnow() - timedelta(minutes=DEDUP_WINDOW_MINUTES)
-    existing = (
-        db.query(Attendance)
-        .filter(
-            Attendance.person_id == person.id,
-            Attendance.timestamp >= since,
-            Attendance.emotion == emotion,
-        )
-        .order_by(Attendance.timestamp.desc())
-        .first()
-    )
-    if existing:
-        return {
-            "ok": True,
-            "id": existing.id,
-            "name": person.name,
-            "emotion": existing.emotion,
-            "timestamp": existing.timestamp.isoformat(),
-            "deduped": True,
-        }
-
-    a = Attendance(person_id=person.id, emotion=emotion)
-    db.add(a)
-    db.commit()
-    db.refresh(a)
-    return {
-        "ok": True,
-        "id": a.id,
-        "name": person.name,
-        "emotion": a.emotion,
-        "timestamp": a.timestamp.isoformat(),
-        "deduped": False,
-    }
+    return _record_mark(db, _resolve_person_id(db, name), name, emotion)
 
 
 @app.post("/api/attendance/mark_self", tags=["attendance"])
@@ -107,45 +312,85 @@ def mark_attendance_self(
     me: Account = Depends(get_current_account),
 ):
     # person = current username
-    person = db.query(Person).filter(Person.name == me.username).first()
-    if not person:
-        person = Person(name=me.username)
-        db.add(person)
-        db.commit()
-        db.refresh(person)
-
-   
-    since = datetime.utcnow() - timedelta(minutes=DEDUP_WINDOW_MINUTES)
-    existing = (
-        db.query(Attendance)
-        .filter(
-            Attendance.person_id == person.id,
-            Attendance.timestamp >= since,
-            Attendance.emotion == emotion,
+    return _record_mark(db, _resolve_person_id(db, me.username), me.username, emotion)
+
+
+@app.post("/api/attendance/mark_bulk", tags=["attendance"])
+def mark_attendance_bulk(
+    payload: BulkMarkRequest,
+    db: Session = Depends(get_db),
+    _: Account = Depends(get_current_account),
+):
+    now = datetime.utcnow()
+    window = timedelta(minutes=DEDUP_WINDOW_MINUTES)
+    items = [(i, m.name, m.emotion, naive_utc(m.timestamp) if m.timestamp is not None else now) for i, m in enumerate(payload.marks)]
+    if not items:
+        return {"ok": True, "inserted": 0, "deduped": 0, "results": []}
+
+    # resolve every name in one pass, creating the missing persons
+    person_ids, created = _resolve_person_ids(db, sorted({name for _, name, _, _ in items}))
+
+    # existing marks that could dedup anything in the batch, per (person, emotion), time-ordered
+    lo = min(t for _, _, _, t in items) - window
+    hi = max(t for _, _, _, t in items) + window
+    existing = {}
+    for chunk in _chunks(sorted(set(person_ids.values()))):
+        rows = (
+            db.query(Attendance.id, Attendance.person_id, Attendance.emotion, Attendance.timestamp)
+            .filter(Attendance.person_id.in_(chunk), Attendance.timestamp >= lo, Attendance.timestamp <= hi)
+            .order_by(Attendance.timestamp)
         )
-        .order_by(Attendance.timestamp.desc())
-        .first()
-    )
-    if existing:
-        return {
-            "ok": True,
-            "id": existing.id,
-            "name": person.name,
-            "emotion": existing.emotion,
-            "timestamp": existing.timestamp.isoformat(),
-            "deduped": True,
-        }
-
-    # else create new
-    a = Attendance(person_id=person.id, emotion=emotion)
-    db.add(a)
+        for r in rows:
+            stamps, ids = existing.setdefault((r.person_id, r.emotion), ([], []))
+            stamps.append(r.timestamp); ids.append(r.id)
+
+    # chronological pass: a mark is a duplicate of a stored mark within the window on either side,
+    # or of the previous accepted mark from this batch
+    results = [None] * len(items)
+    accepted = {}
+    new_rows = []
+    for i, name, emo, ts in sorted(items, key=lambda it: (it[3], it[0])):
+        key = (person_ids[name], emo)
+        match = None
+        if key in existing:
+            stamps, ids = existing[key]
+            j = bisect_right(stamps, ts + window)
+            if j > bisect_left(stamps, ts - window):
+                match = (stamps[j - 1], ids[j - 1])
+        last = accepted.get(key)
+        if last is not None and ts - last.timestamp <= window and (match is None or last.timestamp >= match[0]):
+            match = last
+        if match is not None:
+            results[i] = (match, True)
+            continue
+        a = Attendance(person_id=key[0], emotion=emo, timestamp=ts)
+        accepted[key] = a
+        new_rows.append(a)
+        results[i] = (a, False)
+
+    db.add_all(new_rows)
+    rollup = {}
+    for a in new_rows:
+        rk = (a.person_id, a.emotion, a.timestamp.date())
+        rollup[rk] = rollup.get(rk, 0) + 1
+    for (person_id, emo, day), n in rollup.items():
+        bump_rollup(db, person_id, emo, datetime(day.year, day.month, day.day), n)
+    names = {pid: name for name, pid in person_ids.items()}
+    add_point_sessions(db, ((a.person_id, names[a.person_id], a.timestamp) for a in new_rows))
+    db.flush()
+
+    # read ids before commit expires the instances
+    out = []
+    for i, (match, deduped) in enumerate(results):
+        if isinstance(match, Attendance):
+            row_id, ts, emo = match.id, match.timestamp, match.emotion
+        else:
+            ts, row_id = match
+            emo = items[i][2]
+        out.append({"index": i, "id": row_id, "name": items[i][1], "emotion": emo, "timestamp": ts.isoformat(), "deduped": deduped})
+    written = [(a.person_id, a.emotion, a.timestamp, a.id) for a in new_rows]
     db.commit()
-    db.refresh(a)
-    return {
-        "ok": True,
-        "id": a.id,
-        "name": person.name,
-        "emotion": a.emotion,
-        "timestamp": a.timestamp.isoformat(),
-        "deduped": False,
-    }
+    person_cache.put_many(created.items())
+    for person_id, emo, ts, row_id in written:
+        dedup_index.record_mark(person_id, emo, ts, row_id)
+    return {"ok": True, "inserted": len(new_rows), "deduped": len(out) - len(new_rows), "results": out}
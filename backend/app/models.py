@@ -1,8 +1,8 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, DateTime, ForeignKey, Boolean, Index
+from sqlalchemy import String, Integer, DateTime, Date, ForeignKey, Boolean, Index, UniqueConstraint
 from .database import Base
-from datetime import datetime
-Index  
+from datetime import date, datetime
+from typing import Optional
 
 class Account(Base):
     __tablename__ = "accounts"
@@ -14,7 +14,10 @@ class Account(Base):
 class Person(Base):
     __tablename__ = "persons"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    name: Mapped[str] = mapped_column(String(120), index=True)
+    name: Mapped[str] = mapped_column(String(120))
+
+    # one Person per name, so concurrent kiosks cannot race-create duplicates; also serves name lookups
+    __table_args__ = (Index("ux_persons_name", "name", unique=True),)
 
 class Attendance(Base):
     __tablename__ = "attendance"
@@ -25,4 +28,26 @@ class Attendance(Base):
 
     person = relationship("Person")
 
-    # Index("ix_attendance_person_time", Attendance.person_id, Attendance.timestamp)   
+    __table_args__ = (Index("ix_attendance_person_emotion_time", "person_id", "emotion", "timestamp"),)
+
+class AttendanceRollup(Base):
+    __tablename__ = "attendance_rollup"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    day: Mapped[date] = mapped_column(Date, index=True)
+    person_id: Mapped[int] = mapped_column(ForeignKey("persons.id"), index=True)
+    emotion: Mapped[str] = mapped_column(String(30))
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+    __table_args__ = (UniqueConstraint("day", "person_id", "emotion", name="uq_rollup_day_person_emotion"),)
+
+class AttendanceSession(Base):
+    """Check-in/check-out pairs folded at write time; `attendance` marks are zero-length sessions."""
+    __tablename__ = "attendance_sessions"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer)
+    user_name: Mapped[str] = mapped_column(String(120))
+    started_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+    ended_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # NULL while checked in
+    minutes: Mapped[int] = mapped_column(Integer, default=0)
+
+    __table_args__ = (Index("ix_sessions_user_start", "user_id", "started_at"),)
@@ -0,0 +1,53 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+PERSON_CACHE_SIZE = int(os.getenv("PERSON_CACHE_SIZE", "10000"))
+
+
+class PersonCache:
+    """Bounded LRU of Person.name -> Person.id. Only committed rows may be put here."""
+
+    def __init__(self, max_entries: int = PERSON_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._ids: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str) -> Optional[int]:
+        with self._lock:
+            pid = self._ids.get(name)
+            if pid is None:
+                self.misses += 1
+                return None
+            self._ids.move_to_end(name)
+            self.hits += 1
+            return pid
+
+    def put(self, name: str, pid: int) -> None:
+        self.put_many([(name, pid)])
+
+    def put_many(self, pairs: Iterable[Tuple[str, int]]) -> None:
+        with self._lock:
+            for name, pid in pairs:
+                self._ids[name] = pid
+                self._ids.move_to_end(name)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+
+    def invalidate(self, name: str) -> None:
+        with self._lock:
+            self._ids.pop(name, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._ids), "hits": self.hits, "misses": self.misses}
+
+
+person_cache = PersonCache()
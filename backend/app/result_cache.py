@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .lazy import LazyModule
+
+cv2 = LazyModule("cv2")
+
+CACHE_ENABLED = os.getenv("EMOTION_CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("EMOTION_CACHE_MAX_ENTRIES", "512"))
+CACHE_MAX_BYTES = int(os.getenv("EMOTION_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("EMOTION_CACHE_TTL_SECONDS", "10"))
+CACHE_PHASH = os.getenv("EMOTION_CACHE_PHASH", "1") == "1"
+CACHE_PHASH_DISTANCE = int(os.getenv("EMOTION_CACHE_PHASH_DISTANCE", "4"))
+
+
+def content_key(file_bytes: bytes, mode: str) -> str:
+    return f"{mode}:{hashlib.blake2b(file_bytes, digest_size=16).hexdigest()}"
+
+
+def perceptual_hash(frame_rgb: np.ndarray) -> int:
+    """64-bit difference hash of the (already downscaled) frame."""
+    gray = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class _Entry:
+    __slots__ = ("faces", "phash", "group", "size", "expires")
+
+    def __init__(self, faces, phash, group, size, expires):
+        self.faces = faces
+        self.phash = phash
+        self.group = group
+        self.size = size
+        self.expires = expires
+
+
+class ResultCache:
+    """LRU + TTL cache of detection payloads, keyed by content hash with an optional perceptual-hash lookup."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL_SECONDS, phash_distance: int = CACHE_PHASH_DISTANCE):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.phash_distance = phash_distance
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.phash_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _live(self, key: str, entry: _Entry, now: float) -> bool:
+        if entry.expires < now:
+            self._drop(key)
+            return False
+        return True
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._live(key, entry, now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.faces
+            return None
+
+    def get_similar(self, phash: int, group: Tuple) -> Optional[List[Dict[str, Any]]]:
+        now = time.monotonic()
+        with self._lock:
+            # newest first: a still scene keeps matching the frame cached just before it
+            for key in reversed(list(self._entries)):
+                entry = self._entries[key]
+                if not self._live(key, entry, now) or entry.group != group or entry.phash is None:
+                    continue
+                if bin(entry.phash ^ phash).count("1") <= self.phash_distance:
+                    self._entries.move_to_end(key)
+                    self.phash_hits += 1
+                    return entry.faces
+            return None
+
+    def miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: str, faces: List[Dict[str, Any]], phash: Optional[int] = None, group: Tuple = ()) -> None:
+        size = len(key) + len(json.dumps(faces))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = _Entry(faces, phash, group, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.phash_hits + self.misses
+            return {
+                "enabled": CACHE_ENABLED,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "phash_hits": self.phash_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.phash_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+result_cache = ResultCache()
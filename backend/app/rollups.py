@@ -0,0 +1,53 @@
+from datetime import date, datetime
+from sqlalchemy import func, insert, delete
+from sqlalchemy.orm import Session
+from .models import Attendance, AttendanceRollup
+
+def _upsert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert(AttendanceRollup)
+
+def bump_rollup(db: Session, person_id: int, emotion: str, timestamp: datetime, n: int = 1) -> None:
+    """Add n marks to the day x person x emotion rollup; runs in the caller's transaction."""
+    stmt = _upsert(db).values(day=timestamp.date(), person_id=person_id, emotion=emotion, count=n)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", "person_id", "emotion"],
+        set_={"count": AttendanceRollup.count + stmt.excluded.count},
+    )
+    db.execute(stmt)
+
+def rebuild_rollups(db: Session, since: date = None) -> int:
+    """Recompute rollups from raw attendance (all days, or from `since` on). Returns rows written."""
+    day = func.date(Attendance.timestamp)
+    src = db.query(day, Attendance.person_id, Attendance.emotion, func.count(Attendance.id))
+    wipe = delete(AttendanceRollup)
+    if since is not None:
+        src = src.filter(Attendance.timestamp >= datetime(since.year, since.month, since.day))
+        wipe = wipe.where(AttendanceRollup.day >= since)
+    src = src.group_by(day, Attendance.person_id, Attendance.emotion)
+    db.execute(wipe)
+    result = db.execute(
+        insert(AttendanceRollup).from_select(
+            ["day", "person_id", "emotion", "count"], src.statement
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+def backfill_if_empty(db: Session) -> None:
+    if db.query(AttendanceRollup.id).first() is None and db.query(Attendance.id).first() is not None:
+        rebuild_rollups(db)
+
+if __name__ == "__main__":
+    import argparse
+    from .database import Base, engine, SessionLocal
+    parser = argparse.ArgumentParser(description="Rebuild attendance rollup tables from raw attendance rows.")
+    parser.add_argument("--since", type=date.fromisoformat, default=None, help="Only rebuild days on/after YYYY-MM-DD")
+    args = parser.parse_args()
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        n = rebuild_rollups(db, args.since)
+    print(f"Rebuilt {n} rollup rows")
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import List, Optional
 
 class LoginRequest(BaseModel):
     username: str
@@ -22,3 +23,11 @@ class AttendanceOut(BaseModel):
     name: str
     emotion: str
     timestamp: datetime
+
+class MarkIn(BaseModel):
+    name: str = Field(min_length=1, max_length=120)
+    emotion: str = Field(min_length=1, max_length=30)
+    timestamp: Optional[datetime] = None
+
+class BulkMarkRequest(BaseModel):
+    marks: List[MarkIn] = Field(max_length=5000)
@@ -2,6 +2,8 @@ from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from .models import Account, Person, Attendance
 from .auth import get_password_hash
+from .rollups import bump_rollup
+from .sessions import apply_event
 
 def seed(db: Session):
     if not db.query(Account).filter_by(username="admin").first():
@@ -20,7 +22,9 @@ def seed(db: Session):
     base_time = datetime.utcnow()
     for i, p in enumerate(persons):
         if not db.query(Attendance).filter(Attendance.person_id == p.id).first():
-            db.add(Attendance(person_id=p.id, emotion=emotions[i % len(emotions)], timestamp=base_time - timedelta(minutes=10*(i+1))))
+            a = Attendance(person_id=p.id, emotion=emotions[i % len(emotions)], timestamp=base_time - timedelta(minutes=10*(i+1)))
+            db.add(a); bump_rollup(db, a.person_id, a.emotion, a.timestamp)
+            apply_event(db, p.id, p.name, "attendance", a.timestamp)
     db.commit()
 
     
\ No newline at end of file
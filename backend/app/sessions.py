@@ -0,0 +1,107 @@
+from datetime import datetime
+from itertools import groupby
+from typing import Iterable, Iterator, Optional, Tuple
+from sqlalchemy import delete, insert, text
+from sqlalchemy.orm import Session
+from .models import Attendance, AttendanceSession
+from .timeutil import naive_utc
+from ..core.database import ensure_attendances_view
+
+OPEN_EVENTS = ("check_in", "in")
+CLOSE_EVENTS = ("check_out", "out")
+POINT_EVENTS = ("attendance",)
+REBUILD_BATCH = 1000
+
+def _minutes(start: datetime, end: datetime) -> int:
+    return max(int((end - start).total_seconds() // 60), 0)
+
+def _open_session(db: Session, user_id: int) -> Optional[AttendanceSession]:
+    return (
+        db.query(AttendanceSession)
+        .filter(AttendanceSession.user_id == user_id, AttendanceSession.ended_at.is_(None))
+        .order_by(AttendanceSession.started_at.desc())
+        .first()
+    )
+
+def apply_event(db: Session, user_id: int, user_name: str, event_type: str, ts: datetime) -> None:
+    """Fold one attendance event into attendance_sessions; runs in the caller's transaction.
+    Same rules as the payroll pairing: a repeated check-in moves the open session's start,
+    a check-out without an open session is ignored."""
+    et = (event_type or "").lower()
+    ts = naive_utc(ts)
+    if et in POINT_EVENTS:
+        db.add(AttendanceSession(user_id=user_id, user_name=user_name, started_at=ts, ended_at=ts, minutes=0))
+        return
+    if et not in OPEN_EVENTS and et not in CLOSE_EVENTS:
+        return
+    s = _open_session(db, user_id)
+    if et in OPEN_EVENTS:
+        if s is None:
+            db.add(AttendanceSession(user_id=user_id, user_name=user_name, started_at=ts, ended_at=None, minutes=0))
+        else:
+            s.started_at, s.user_name = ts, user_name
+    elif et in CLOSE_EVENTS and s is not None:
+        s.ended_at, s.minutes = ts, _minutes(s.started_at, ts)
+    # SessionLocal doesn't autoflush; the next event's open-session lookup must see this one
+    db.flush()
+
+def add_point_sessions(db: Session, marks: Iterable[Tuple[int, str, datetime]]) -> None:
+    """Bulk form of apply_event for `attendance` marks: (user_id, user_name, ts) each."""
+    rows = [{"user_id": uid, "user_name": name, "started_at": ts, "ended_at": ts, "minutes": 0} for uid, name, ts in marks]
+    if rows:
+        db.execute(insert(AttendanceSession), rows)
+
+def _fold(user_id: int, rows: Iterable[Tuple]) -> Iterator[dict]:
+    # one user's time-ordered events -> sessions, mirroring apply_event
+    open_at, open_name = None, None
+    for _, user_name, event_type, created_at in rows:
+        et = (event_type or "").lower()
+        name = user_name or f"User {user_id}"
+        if et in OPEN_EVENTS:
+            open_at, open_name = naive_utc(created_at), name
+        elif et in CLOSE_EVENTS:
+            if open_at is not None:
+                end = naive_utc(created_at)
+                yield {"user_id": user_id, "user_name": open_name, "started_at": open_at, "ended_at": end, "minutes": _minutes(open_at, end)}
+                open_at = None
+        elif et in POINT_EVENTS:
+            t = naive_utc(created_at)
+            yield {"user_id": user_id, "user_name": name, "started_at": t, "ended_at": t, "minutes": 0}
+    if open_at is not None:
+        yield {"user_id": user_id, "user_name": open_name, "started_at": open_at, "ended_at": None, "minutes": 0}
+
+def rebuild_sessions(db: Session) -> int:
+    """Replace attendance_sessions with a replay of the whole `attendances` event feed. Returns rows written."""
+    ensure_attendances_view(db.get_bind())
+    db.execute(delete(AttendanceSession))
+    events = db.execute(
+        text("SELECT user_id, user_name, event_type, created_at FROM attendances ORDER BY user_id, created_at"),
+        execution_options={"yield_per": REBUILD_BATCH},
+    )
+    written, batch = 0, []
+    for user_id, rows in groupby(events, key=lambda r: r[0]):
+        for s in _fold(int(user_id), rows):
+            batch.append(s)
+            if len(batch) >= REBUILD_BATCH:
+                db.execute(insert(AttendanceSession), batch)
+                written += len(batch)
+                batch = []
+    if batch:
+        db.execute(insert(AttendanceSession), batch)
+        written += len(batch)
+    db.commit()
+    return written
+
+def backfill_sessions_if_empty(db: Session) -> None:
+    if db.query(AttendanceSession.id).first() is None and db.query(Attendance.id).first() is not None:
+        rebuild_sessions(db)
+
+if __name__ == "__main__":
+    import argparse
+    from .database import Base, engine, SessionLocal
+    parser = argparse.ArgumentParser(description="Rebuild attendance sessions from the attendance event feed.")
+    parser.parse_args()
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        n = rebuild_sessions(db)
+    print(f"Rebuilt {n} session rows")
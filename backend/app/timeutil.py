@@ -0,0 +1,10 @@
+from datetime import datetime, timezone
+from typing import Any
+
+
+def naive_utc(value: Any) -> datetime:
+    """datetime or ISO string -> naive UTC, the form every timestamp column in this app stores."""
+    if not isinstance(value, datetime):
+        s = str(value)
+        value = datetime.fromisoformat(s[:-1] + "+00:00" if s.endswith("Z") else s)
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
@@ -1,66 +1,80 @@
-import sqlite3, os, pathlib
+import sqlite3, os, pathlib, threading
 from typing import Optional, Tuple, Dict, Any
 
 DB_DIR = pathlib.Path(os.getenv("DB_DIR", "backend/data"))
 DB_DIR.mkdir(parents=True, exist_ok=True)
 DB_PATH = DB_DIR / "auth.sqlite"
+BUSY_TIMEOUT_MS = int(os.getenv("AUTH_DB_BUSY_TIMEOUT_MS", "5000"))
 
-def _conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+USER_COLUMNS = "id, email, username, password_hash, full_name, face_id"
+
+_local = threading.local()
+
+def _conn() -> sqlite3.Connection:
+    # one long-lived connection per thread; sqlite3 keeps a per-connection prepared statement cache
+    con = getattr(_local, "con", None)
+    if con is None:
+        con = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=128)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        _local.con = con
+    return con
+
+def close() -> None:
+    con = getattr(_local, "con", None)
+    if con is not None:
+        con.close()
+        _local.con = None
 
 def init():
     con = _conn()
-    cur = con.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT UNIQUE,
-        username TEXT UNIQUE,
-        password_hash TEXT,
-        full_name TEXT,
-        face_id TEXT,
-        created_at TEXT DEFAULT CURRENT_TIMESTAMP
-    )""")
-    con.commit()
-    con.close()
+    with con:
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS users(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE,
+            username TEXT UNIQUE,
+            password_hash TEXT,
+            full_name TEXT,
+            face_id TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )""")
+        con.execute("CREATE INDEX IF NOT EXISTS ix_users_face_id ON users(face_id)")
 
 def create_user(email: str, username: str, password_hash: str, full_name: str) -> int:
     con = _conn()
-    cur = con.cursor()
-    cur.execute("INSERT INTO users(email, username, password_hash, full_name) VALUES(?,?,?,?)",
-                (email, username, password_hash, full_name))
-    con.commit()
-    uid = cur.lastrowid
-    con.close()
-    return uid
+    with con:
+        cur = con.execute("INSERT INTO users(email, username, password_hash, full_name) VALUES(?,?,?,?)",
+                          (email, username, password_hash, full_name))
+    return cur.lastrowid
+
+def _fetch_one(sql: str, params: Tuple) -> Optional[Tuple]:
+    return _conn().execute(sql, params).fetchone()
 
 def get_user_by_email(email: str) -> Optional[Tuple]:
-    con = _conn()
-    cur = con.cursor()
-    cur.execute("SELECT id, email, username, password_hash, full_name, face_id FROM users WHERE email=?", (email,))
-    row = cur.fetchone()
-    con.close()
-    return row
+    return _fetch_one(f"SELECT {USER_COLUMNS} FROM users WHERE email=?", (email,))
 
 def get_user_by_username(username: str) -> Optional[Tuple]:
-    con = _conn()
-    cur = con.cursor()
-    cur.execute("SELECT id, email, username, password_hash, full_name, face_id FROM users WHERE username=?", (username,))
-    row = cur.fetchone()
-    con.close()
-    return row
+    return _fetch_one(f"SELECT {USER_COLUMNS} FROM users WHERE username=?", (username,))
+
+def get_user_by_id(user_id: int) -> Optional[Tuple]:
+    return _fetch_one(f"SELECT {USER_COLUMNS} FROM users WHERE id=?", (user_id,))
+
+def get_user_by_identity(identity: str) -> Optional[Tuple]:
+    # one round trip for "email or username"; an email match wins, as with the two separate lookups
+    return _fetch_one(
+        f"SELECT {USER_COLUMNS} FROM users WHERE email=?1 OR username=?1 ORDER BY email=?1 DESC LIMIT 1",
+        (identity,),
+    )
+
+def email_or_username_taken(email: str, username: str) -> bool:
+    return _fetch_one("SELECT 1 FROM users WHERE email=? OR username=? LIMIT 1", (email, username)) is not None
 
 def set_face_id(user_id: int, face_id: str) -> None:
     con = _conn()
-    cur = con.cursor()
-    cur.execute("UPDATE users SET face_id=? WHERE id=?", (face_id, user_id))
-    con.commit()
-    con.close()
+    with con:
+        con.execute("UPDATE users SET face_id=? WHERE id=?", (face_id, user_id))
 
 def get_user_by_face_id(face_id: str) -> Optional[Tuple]:
-    con = _conn()
-    cur = con.cursor()
-    cur.execute("SELECT id, email, username, password_hash, full_name, face_id FROM users WHERE face_id=?", (face_id,))
-    row = cur.fetchone()
-    con.close()
-    return row
+    return _fetch_one(f"SELECT {USER_COLUMNS} FROM users WHERE face_id=?", (face_id,))
@@ -0,0 +1,156 @@
+import os
+import asyncio
+import itertools
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.engine import Engine, Row
+from dotenv import load_dotenv
+
+load_dotenv()
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./facesense.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_ITER_BATCH = int(os.getenv("DB_ITER_BATCH", "1000"))
+
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def _create_engine(url: str) -> Engine:
+    if url.startswith("sqlite"):
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True)
+
+
+_MS_CREATED_AT = "strftime('%Y-%m-%dT%H:%M:%f', a.timestamp)"
+
+
+_feed_is_view: Dict[str, bool] = {}
+
+
+def attendances_is_view(engine: Engine) -> bool:
+    """True when `attendances` is a view (the app's own marks) rather than a table other writers append to.
+    Checked once per database; False, uncached, if the schema can't be inspected."""
+    key = str(engine.url)
+    if key not in _feed_is_view:
+        try:
+            _feed_is_view[key] = "attendances" in inspect(engine).get_view_names()
+        except Exception:
+            return False
+    return _feed_is_view[key]
+
+
+def ensure_attendances_view(engine: Engine) -> None:
+    """Expose the app's attendance marks as the `attendances` event feed reports and calendar read,
+    unless a real table or another view of that name already exists. DDL: run from the schema step, not per request."""
+    insp = inspect(engine)
+    if "attendances" in insp.get_table_names():  # has_table() is true for views as well
+        return
+    replace = False
+    if "attendances" in insp.get_view_names():
+        # earlier sqlite definition cut created_at to milliseconds; sessions folded at write time keep microseconds
+        replace = engine.dialect.name == "sqlite" and _MS_CREATED_AT in (insp.get_view_definition("attendances") or "")
+        if not replace:
+            return
+    if not (insp.has_table("attendance") and insp.has_table("persons")):
+        return
+    if engine.dialect.name == "sqlite":
+        # stored text with a 'T', full microseconds, so BETWEEN against ISO parameters compares correctly
+        created_at = "replace(a.timestamp, ' ', 'T')"
+    else:
+        created_at = "a.timestamp"
+    with engine.begin() as con:
+        if replace:
+            con.exec_driver_sql("DROP VIEW attendances")
+        con.exec_driver_sql(
+            "CREATE VIEW attendances AS "
+            f"SELECT a.id AS id, a.person_id AS user_id, p.name AS user_name, 'attendance' AS event_type, {created_at} AS created_at "
+            "FROM attendance a JOIN persons p ON p.id = a.person_id"
+        )
+
+
+def get_engine(url: Optional[str] = None) -> Engine:
+    """One pooled engine per URL for the whole process."""
+    url = url or DATABASE_URL
+    engine = _engines.get(url)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(url)
+            if engine is None:
+                engine = _create_engine(url)
+                _engines[url] = engine
+    return engine
+
+
+def _qmark_to_format(sql: str) -> str:
+    # callers write sqlite-style '?' placeholders; format/pyformat drivers (psycopg2) want '%s'
+    out, quoted = [], False
+    for ch in sql:
+        if ch == "'":
+            quoted = not quoted
+        if ch == "%":
+            out.append("%%")
+        elif ch == "?" and not quoted:
+            out.append("%s")
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+class Database:
+    """Thin raw-SQL facade over a shared, pooled engine. Cheap to construct per call."""
+
+    def __init__(self, url: Optional[str] = None):
+        self.engine = get_engine(url)
+        self._format = self.engine.dialect.paramstyle in ("format", "pyformat")
+
+    def _sql(self, sql: str) -> str:
+        return _qmark_to_format(sql) if self._format else sql
+
+    def fetch_all(self, sql: str, params: Sequence[Any] = ()) -> List[Row]:
+        with self.engine.connect() as con:
+            return con.exec_driver_sql(self._sql(sql), tuple(params)).fetchall()
+
+    def fetch_one(self, sql: str, params: Sequence[Any] = ()) -> Optional[Row]:
+        with self.engine.connect() as con:
+            return con.exec_driver_sql(self._sql(sql), tuple(params)).first()
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        with self.engine.begin() as con:
+            return con.exec_driver_sql(self._sql(sql), tuple(params)).rowcount
+
+    def iter_rows(self, sql: str, params: Sequence[Any] = (), batch: int = DB_ITER_BATCH) -> Iterator[Row]:
+        """Stream rows with a server-side cursor (named cursor on Postgres); memory stays at one batch."""
+        with self.engine.connect() as con:
+            result = con.execution_options(stream_results=True, yield_per=batch).exec_driver_sql(self._sql(sql), tuple(params))
+            for rows in result.partitions(batch):
+                yield from rows
+
+
+class AsyncDatabase:
+    """Same API for async endpoints; blocking driver calls run in worker threads, off the event loop."""
+
+    def __init__(self, url: Optional[str] = None):
+        self.db = Database(url)
+
+    async def fetch_all(self, sql: str, params: Sequence[Any] = ()) -> List[Row]:
+        return await asyncio.to_thread(self.db.fetch_all, sql, params)
+
+    async def fetch_one(self, sql: str, params: Sequence[Any] = ()) -> Optional[Row]:
+        return await asyncio.to_thread(self.db.fetch_one, sql, params)
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        return await asyncio.to_thread(self.db.execute, sql, params)
+
+    async def iter_rows(self, sql: str, params: Sequence[Any] = (), batch: int = DB_ITER_BATCH) -> AsyncIterator[Row]:
+        rows = self.db.iter_rows(sql, params, batch)
+        try:
+            while True:
+                chunk = await asyncio.to_thread(lambda: list(itertools.islice(rows, batch)))
+                if not chunk:
+                    break
+                for row in chunk:
+                    yield row
+        finally:
+            await asyncio.to_thread(rows.close)
@@ -1,46 +1,328 @@
-from typing import Optional
+from typing import Any, Dict, List, Optional, Tuple
+from collections import Counter
+import os
+import time
+import random
+import asyncio
+import threading
 import httpx
 
-async def _post_webhook(url: str, payload: dict) -> None:
-    timeout = httpx.Timeout(10.0, connect=10.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
+ALERT_WORKERS = int(os.getenv("ALERT_WORKERS", "4"))
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", "1000"))
+ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "4"))
+ALERT_BACKOFF_SECONDS = float(os.getenv("ALERT_BACKOFF_SECONDS", "0.5"))
+ALERT_BACKOFF_MAX_SECONDS = float(os.getenv("ALERT_BACKOFF_MAX_SECONDS", "30"))
+ALERT_TIMEOUT_SECONDS = float(os.getenv("ALERT_TIMEOUT_SECONDS", "10"))
+ALERT_MODE = os.getenv("ALERT_MODE", "immediate")  # immediate | digest
+ALERT_DIGEST_WINDOW_SECONDS = float(os.getenv("ALERT_DIGEST_WINDOW_SECONDS", "60"))
+ALERT_DIGEST_MAX_EVENTS = int(os.getenv("ALERT_DIGEST_MAX_EVENTS", "200"))
+ALERT_DIGEST_NAMES = int(os.getenv("ALERT_DIGEST_NAMES", "10"))
+
+AlertEvent = Tuple[str, str, str, str]  # user_name, emotion, event_type, timestamp_iso
+
+
+def _retryable(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+class WebhookDispatcher:
+    """Delivers webhook posts from an in-process queue over one pooled client, off the request path.
+
+    Network errors, 429 and 5xx are retried with capped exponential backoff; other 4xx are final.
+    A full queue drops the message rather than blocking the caller."""
+
+    def __init__(
+        self,
+        workers: int = ALERT_WORKERS,
+        max_queue: int = ALERT_QUEUE_SIZE,
+        max_attempts: int = ALERT_MAX_ATTEMPTS,
+        backoff: float = ALERT_BACKOFF_SECONDS,
+        backoff_max: float = ALERT_BACKOFF_MAX_SECONDS,
+        timeout: float = ALERT_TIMEOUT_SECONDS,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.attempt_total = 0.0
+        self.attempts = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        self._start()
+
+    def _start(self) -> None:
+        # needs a running loop; the workers, queue and client all belong to it
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        limits = httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers)
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(self.timeout, connect=self.timeout), limits=limits)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"webhook-{i}") for i in range(self.workers)]
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """Give queued messages up to drain_timeout seconds, then cancel the workers and close the client."""
+        if not self.running:
+            return
         try:
-            await client.post(url, json=payload)
-        except Exception:
-            print("Webhook post failed:", url)
+            await asyncio.wait_for(self._queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._client.aclose()
+        self._client = None
+
+    async def drain(self) -> None:
+        """Wait until every queued message has been delivered or given up on."""
+        if self.running:
+            await self._queue.join()
+
+    def submit(self, url: str, payload: dict) -> bool:
+        """Queue one post; safe from the event loop or from a worker thread. False if it was dropped."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if not self.running:
+            if running is None:
+                with self._lock:
+                    self.dropped += 1
+                print("Webhook dispatcher not running, dropped:", url)
+                return False
+            self._start()
+        item = (url, payload, time.perf_counter())
+        if running is self._loop:
+            return self._put(item)
+        self._loop.call_soon_threadsafe(self._put, item)
+        return True
+
+    def _put(self, item: Tuple[str, dict, float]) -> bool:
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            with self._lock:
+                self.dropped += 1
+            print("Webhook queue full, dropped:", item[0])
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            url, payload, queued_at = await self._queue.get()
+            try:
+                try:
+                    ok = await self._deliver(url, payload)
+                except Exception as e:  # bad URL, payload encoding...; never let it kill the worker
+                    print("Webhook post failed:", url, repr(e))
+                    ok = False
+                latency = time.perf_counter() - queued_at
+                with self._lock:
+                    if ok:
+                        self.delivered += 1
+                        self.latency_total += latency
+                        self.latency_max = max(self.latency_max, latency)
+                    else:
+                        self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, url: str, payload: dict) -> bool:
+        for attempt in range(1, self.max_attempts + 1):
+            started = time.perf_counter()
+            retry_after = None
+            try:
+                resp = await self._client.post(url, json=payload)
+                if resp.status_code < 400:
+                    return True
+                if not _retryable(resp.status_code):
+                    print("Webhook rejected:", url, resp.status_code)
+                    return False
+                retry_after = resp.headers.get("Retry-After")
+                reason = f"HTTP {resp.status_code}"
+            except httpx.HTTPError as e:
+                reason = type(e).__name__
+            finally:
+                with self._lock:
+                    self.attempts += 1
+                    self.attempt_total += time.perf_counter() - started
+            if attempt == self.max_attempts:
+                print("Webhook post failed:", url, reason)
+                return False
+            with self._lock:
+                self.retries += 1
+            delay = min(self.backoff_max, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            if retry_after and retry_after.isdigit():
+                delay = min(self.backoff_max, max(delay, float(retry_after)))
+            await asyncio.sleep(delay)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = self.delivered
+            return {
+                "running": self.running,
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+                "max_queue": self.max_queue,
+                "enqueued": self.enqueued,
+                "delivered": n,
+                "failed": self.failed,
+                "retries": self.retries,
+                "dropped": self.dropped,
+                "delivery_latency_avg_ms": round(1000 * self.latency_total / n, 3) if n else 0.0,
+                "delivery_latency_max_ms": round(1000 * self.latency_max, 3),
+                "attempt_avg_ms": round(1000 * self.attempt_total / self.attempts, 3) if self.attempts else 0.0,
+            }
+
+
+webhook_dispatcher = WebhookDispatcher()
+
+def _post_webhook(url: str, payload: dict) -> bool:
+    return webhook_dispatcher.submit(url, payload)
+
+def _event_title(event_type: str) -> str:
+    return event_type.replace('_',' ').title()
+
+def _teams_card(summary: str, title: str, facts: List[Tuple[str, str]]) -> dict:
+    return {
+        "@type": "MessageCard",
+        "@context": "http://schema.org/extensions",
+        "summary": summary,
+        "themeColor": "0076D7",
+        "title": title,
+        "sections": [{
+            "facts": [{"name": name, "value": value} for name, value in facts]
+        }]
+    }
+
+def _event_payload(kind: str, event: AlertEvent) -> dict:
+    user_name, emotion, event_type, timestamp_iso = event
+    if kind == "slack":
+        return {
+            "text": f":bell: Attendance {_event_title(event_type)}\n"
+                    f"*User:* {user_name}\n*Emotion:* {emotion}\n*Time:* {timestamp_iso}"
+        }
+    return _teams_card("Attendance event", f"Attendance {_event_title(event_type)}",
+                       [("User", user_name), ("Emotion", emotion), ("Time", timestamp_iso)])
+
+def _counts(values) -> str:
+    return ", ".join(f"{v} {n}" for v, n in Counter(values).most_common())
+
+def _digest_payload(kind: str, events: List[AlertEvent], max_names: int) -> dict:
+    names = list(dict.fromkeys(e[0] for e in events))
+    shown = ", ".join(names[:max_names]) + (f" and {len(names) - max_names} more" if len(names) > max_names else "")
+    window = f"{events[0][3]} - {events[-1][3]}"
+    by_event = _counts(_event_title(e[2]) for e in events)
+    by_emotion = _counts(e[1] for e in events)
+    title = f"Attendance digest: {len(events)} event{'s' if len(events) != 1 else ''}"
+    if kind == "slack":
+        return {
+            "text": f":bell: {title}\n*Window:* {window}\n*By event:* {by_event}\n"
+                    f"*By emotion:* {by_emotion}\n*Users:* {shown}"
+        }
+    return _teams_card("Attendance digest", title,
+                       [("Window", window), ("By event", by_event), ("By emotion", by_emotion), ("Users", shown)])
+
+
+class AlertCoalescer:
+    """Buffers events per webhook and posts one summary per flush: after `window` seconds from the
+    first buffered event, or as soon as `max_events` are waiting. Runs on the event loop only."""
+
+    def __init__(
+        self,
+        dispatcher: WebhookDispatcher,
+        window: float = ALERT_DIGEST_WINDOW_SECONDS,
+        max_events: int = ALERT_DIGEST_MAX_EVENTS,
+        max_names: int = ALERT_DIGEST_NAMES,
+    ):
+        self.dispatcher = dispatcher
+        self.window = window
+        self.max_events = max(1, max_events)
+        self.max_names = max_names
+        self._buffers: Dict[Tuple[str, str], List[AlertEvent]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self.events = 0
+        self.flushes = 0
+
+    def add(self, kind: str, url: str, event: AlertEvent) -> None:
+        key = (kind, url)
+        buf = self._buffers.setdefault(key, [])
+        buf.append(event)
+        self.events += 1
+        if len(buf) >= self.max_events:
+            self._flush(key)
+        elif len(buf) == 1:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+
+    def _flush(self, key: Tuple[str, str]) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        events = self._buffers.pop(key, None)
+        if not events:
+            return
+        kind, url = key
+        self.flushes += 1
+        self.dispatcher.submit(url, _digest_payload(kind, events, self.max_names))
+
+    def flush_all(self) -> None:
+        for key in list(self._buffers):
+            self._flush(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window,
+            "max_events": self.max_events,
+            "buffered": sum(len(b) for b in self._buffers.values()),
+            "events": self.events,
+            "flushes": self.flushes,
+        }
+
+
+alert_coalescer = AlertCoalescer(webhook_dispatcher)
 
 async def send_attendance_alert(
     slack_webhook: Optional[str],
     teams_webhook: Optional[str],
-    *, 
+    *,
     user_name: str,
     emotion: str,
     event_type: str,
-    timestamp_iso: str
+    timestamp_iso: str,
+    mode: Optional[str] = None
 ) -> None:
-    slack_payload = {
-        "text": f":bell: Attendance {event_type.replace('_',' ').title()}\n"
-                f"*User:* {user_name}\n*Emotion:* {emotion}\n*Time:* {timestamp_iso}"
-    }
-    teams_payload = {
-        "@type": "MessageCard",
-        "@context": "http://schema.org/extensions",
-        "summary": "Attendance event",
-        "themeColor": "0076D7",
-        "title": f"Attendance {event_type.replace('_',' ').title()}",
-        "sections": [{
-            "facts": [
-                {"name": "User", "value": user_name},
-                {"name": "Emotion", "value": emotion},
-                {"name": "Time", "value": timestamp_iso},
-            ]
-        }]
-    }
-    tasks = []
-    if slack_webhook:
-        tasks.append(_post_webhook(slack_webhook, slack_payload))
-    if teams_webhook:
-        tasks.append(_post_webhook(teams_webhook, teams_payload))
-    if tasks:
-        import asyncio
-        await asyncio.gather(*tasks, return_exceptions=True)
+    """Queue the alert for each configured webhook. mode: "immediate" posts one message per event,
+    "digest" folds it into the target's next summary; defaults to ALERT_MODE."""
+    event = (user_name, emotion, event_type, timestamp_iso)
+    digest = (mode or ALERT_MODE) == "digest"
+    # queued for the background workers; the caller never waits on Slack/Teams
+    for kind, url in (("slack", slack_webhook), ("teams", teams_webhook)):
+        if not url:
+            continue
+        if digest:
+            alert_coalescer.add(kind, url, event)
+        else:
+            _post_webhook(url, _event_payload(kind, event))
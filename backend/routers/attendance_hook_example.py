@@ -1,9 +1,9 @@
 from datetime import datetime, timezone
-from .settings import _load
+from .settings import settings_store
 from ..integrations.alerts import send_attendance_alert
 
 async def notify_attendance_event(*, user_name: str, emotion: str, event_type: str):
-    data = _load()
+    data = settings_store.get()  # in-memory; no file read per event
     integrations = data.get("integrations", {})
     slack_webhook = integrations.get("slack_webhook")
     teams_webhook = integrations.get("teams_webhook")
@@ -6,8 +6,10 @@ import os
 
 from passlib.context import CryptContext
 from jose import jwt
+from starlette.concurrency import run_in_threadpool
 
 from backend.core import auth_db
+from backend.app.hashing import password_hasher
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
@@ -56,21 +58,24 @@ def _issue_jwt(user_row) -> TokenResp:
     return TokenResp(access_token=token, user_display=full_name or username or email)
 
 @router.post("/register", response_model=TokenResp)
-def register(req: RegisterReq):
-    if auth_db.get_user_by_email(req.email) or auth_db.get_user_by_username(req.username):
+async def register(req: RegisterReq):
+    if await run_in_threadpool(auth_db.email_or_username_taken, req.email, req.username):
         raise HTTPException(status_code=409, detail="Email or username already exists")
-    ph = pwd.hash(req.password)
-    uid = auth_db.create_user(req.email, req.username, ph, req.full_name)
-    row = auth_db.get_user_by_username(req.username)
+    ph = await password_hasher.hash(pwd, req.password)
+
+    def _create():
+        uid = auth_db.create_user(req.email, req.username, ph, req.full_name)
+        return auth_db.get_user_by_id(uid)
+    row = await run_in_threadpool(_create)
     return _issue_jwt(row)
 
 @router.post("/login", response_model=TokenResp)
-def login(req: LoginReq):
-    user = auth_db.get_user_by_email(req.identity) or auth_db.get_user_by_username(req.identity)
+async def login(req: LoginReq):
+    user = await run_in_threadpool(auth_db.get_user_by_identity, req.identity)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     _, email, username, password_hash, full_name, _ = user
-    if not pwd.verify(req.password, password_hash):
+    if not await password_hasher.verify(pwd, req.password, password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     return _issue_jwt(user)
 
@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Query, Response, HTTPException
-from typing import List, Dict, Any
-from datetime import datetime, timezone
+from fastapi import APIRouter, Query, Response, HTTPException, Header
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from datetime import date, datetime, time, timedelta, timezone
+from collections import OrderedDict
+from email.utils import format_datetime, parsedate_to_datetime
+from itertools import chain, groupby
+import hashlib, os, threading
 
 try:
     from backend.core.database import Database
@@ -9,58 +14,181 @@ except Exception:
 
 router = APIRouter(prefix="/api/calendar", tags=["calendar"])
 
-def _fetch_checkins(from_iso: str, to_iso: str) -> List[Dict[str, Any]]:
-    if Database is None:
-        return []
-    db = Database()
+ICS_DAY_CACHE_SIZE = int(os.getenv("ICS_DAY_CACHE_SIZE", "1000"))
+CHECKIN_FILTER = "event_type IN ('check_in','in','attendance') AND created_at BETWEEN ? AND ?"
+ICS_HEAD = "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//FaceSense//Calendar//EN"
+ICS_TAIL = "\r\nEND:VCALENDAR"
+
+DaySig = Tuple[int, str, str]  # count, min(created_at), max(created_at)
+
+
+class DayRenderCache:
+    """Rendered VEVENT text per closed day, reused while the day's signature is unchanged."""
+
+    def __init__(self, max_entries: int = ICS_DAY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._days: "OrderedDict[str, Tuple[DaySig, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, day: str, sig: DaySig) -> Optional[str]:
+        with self._lock:
+            entry = self._days.get(day)
+            if entry is None or entry[0] != sig:
+                self.misses += 1
+                return None
+            self._days.move_to_end(day)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, day: str, sig: DaySig, text: str) -> None:
+        with self._lock:
+            self._days[day] = (sig, text)
+            self._days.move_to_end(day)
+            while len(self._days) > self.max_entries:
+                self._days.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._days), "hits": self.hits, "misses": self.misses}
+
+
+day_cache = DayRenderCache()
+
+def _as_utc(value: Any) -> datetime:
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return dt.astimezone(timezone.utc)
+
+def _day_key(created_at: Any) -> str:
+    # must agree with the SQL day expression in _day_signatures
+    return created_at.date().isoformat() if isinstance(created_at, datetime) else str(created_at)[:10]
+
+def _day_signatures(db, from_iso: str, to_iso: str) -> List[Tuple[str, DaySig]]:
+    """One aggregate query: per-day count and min/max created_at of the check-ins in range."""
+    day = "substr(created_at, 1, 10)" if db.engine.dialect.name == "sqlite" else "CAST(created_at AS DATE)"
     rows = db.fetch_all(
-        "SELECT user_id, user_name, created_at FROM attendances "
-        "WHERE event_type IN ('check_in','in','attendance') AND created_at BETWEEN ? AND ? "
-        "ORDER BY created_at ASC",
+        f"SELECT {day} AS day, COUNT(*), MIN(created_at), MAX(created_at) FROM attendances "
+        f"WHERE {CHECKIN_FILTER} GROUP BY day ORDER BY day",
         (from_iso, to_iso)
     )
-    out = []
-    for r in rows:
-        if isinstance(r, dict):
-            uid = r.get("user_id")
-            name = r.get("user_name") or f"User {uid}"
-            created_at = r.get("created_at")
-        else:
-            uid, name, created_at = r
-            name = name or f"User {uid}"
-        if isinstance(created_at, datetime):
-            iso = created_at.astimezone(timezone.utc).isoformat()
-        else:
-            iso = str(created_at)
-        out.append({"user_id": uid, "user_name": name, "created_at_iso": iso})
-    return out
+    return [(str(d), (int(n), str(lo), str(hi))) for d, n, lo, hi in rows]
+
+def _render_event(user_id: Any, user_name: Optional[str], created_at: Any) -> str:
+    dtstamp = _as_utc(created_at).strftime("%Y%m%dT%H%M%SZ")
+    return (
+        "\r\nBEGIN:VEVENT"
+        f"\r\nUID:{user_id}-{dtstamp}@face-attendance"
+        f"\r\nDTSTAMP:{dtstamp}"
+        f"\r\nDTSTART:{dtstamp}"
+        f"\r\nDTEND:{dtstamp}"
+        f"\r\nSUMMARY:Attendance: {user_name or f'User {user_id}'}"
+        "\r\nEND:VEVENT"
+    )
+
+def _etag_matches(header: str, etag: str) -> bool:
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+def _closed_days(days: List[Tuple[str, DaySig]], from_iso: str, to_iso: str) -> set:
+    # a day is reusable once it is over and the requested range covers all of it
+    try:
+        lo, hi = (datetime.fromisoformat(v.replace("Z", "+00:00")) for v in (from_iso, to_iso))
+    except ValueError:
+        return set()
+    lo, hi = (v.astimezone(timezone.utc).replace(tzinfo=None) if v.tzinfo else v for v in (lo, hi))
+    today = datetime.now(timezone.utc).date()
+    closed = set()
+    for d, _ in days:
+        start = datetime.combine(date.fromisoformat(d), time(0))
+        if start.date() < today and lo <= start and start + timedelta(days=1) - timedelta(microseconds=1) <= hi:
+            closed.add(d)
+    return closed
+
+def _not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], etag: str, last_modified: Optional[datetime]) -> bool:
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _render_run(db, first_day: str, last_day: str, from_iso: str, to_iso: str) -> Iterator[Tuple[str, str]]:
+    """(day, VEVENT text) for consecutive uncached days, from one ordered read of just those days."""
+    upper = (date.fromisoformat(last_day) + timedelta(days=1)).isoformat()
+    rows = db.iter_rows(
+        f"SELECT user_id, user_name, created_at FROM attendances WHERE {CHECKIN_FILTER} "
+        "AND created_at >= ? AND created_at < ? ORDER BY created_at ASC",
+        (from_iso, to_iso, first_day, upper)
+    )
+    first = next(rows, None)  # run the query now so DB errors surface before the response starts
+    rows = chain([first], rows) if first is not None else iter(())
+    return ((d, "".join(_render_event(*r) for r in group)) for d, group in groupby(rows, key=lambda r: _day_key(r[2])))
+
+def _stream_ics(db, days: List[Tuple[str, DaySig]], closed: set, from_iso: str, to_iso: str) -> Iterator[str]:
+    cached = [day_cache.get(d, sig) if d in closed else None for d, sig in days]
+    runs = []  # [start, end) index ranges of days that must be rendered
+    for i, text in enumerate(cached):
+        if text is None:
+            if runs and runs[-1][1] == i:
+                runs[-1][1] = i + 1
+            else:
+                runs.append([i, i + 1])
+    first_run = _render_run(db, days[runs[0][0]][0], days[runs[0][1] - 1][0], from_iso, to_iso) if runs else None
+
+    def body() -> Iterator[str]:
+        yield ICS_HEAD
+        pos = 0
+        for n, (lo, hi) in enumerate(runs):
+            yield from cached[pos:lo]
+            rendered = first_run if n == 0 else _render_run(db, days[lo][0], days[hi - 1][0], from_iso, to_iso)
+            current = next(rendered, None)
+            for d, sig in days[lo:hi]:
+                while current is not None and current[0] < d:
+                    current = next(rendered, None)
+                text = ""
+                if current is not None and current[0] == d:
+                    text = current[1]
+                    current = next(rendered, None)
+                if d in closed:
+                    day_cache.put(d, sig, text)
+                yield text
+            pos = hi
+        yield from cached[pos:]
+        yield ICS_TAIL
+
+    return body()
 
 @router.get("/attendance.ics")
 def ics_feed(
     from_iso: str = Query(..., description="Start datetime ISO (inclusive)"),
-    to_iso: str = Query(..., description="End datetime ISO (inclusive)")
+    to_iso: str = Query(..., description="End datetime ISO (inclusive)"),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
 ) -> Response:
+    if Database is None:
+        return Response(content=ICS_HEAD + ICS_TAIL, media_type="text/calendar")
     try:
-        events = _fetch_checkins(from_iso, to_iso)
+        db = Database()
+        days = _day_signatures(db, from_iso, to_iso)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"DB fetch failed: {e}")
 
-    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//FaceSense//Calendar//EN"]
-    for ev in events:
-        dt = datetime.fromisoformat(ev["created_at_iso"].replace("Z","+00:00"))
-        dt_utc = dt.astimezone(timezone.utc)
-        dtstamp = dt_utc.strftime("%Y%m%dT%H%M%SZ")
-        uid = f"{ev['user_id']}-{dtstamp}@face-attendance"
-        title = f"Attendance: {ev['user_name']}"
-        lines += [
-            "BEGIN:VEVENT",
-            f"UID:{uid}",
-            f"DTSTAMP:{dtstamp}",
-            f"DTSTART:{dtstamp}",
-            f"DTEND:{dtstamp}",
-            f"SUMMARY:{title}",
-            "END:VEVENT"
-        ]
-    lines.append("END:VCALENDAR")
-    ics = "\r\n".join(lines)
-    return Response(content=ics, media_type="text/calendar")
+    etag = '"' + hashlib.blake2b(repr((from_iso, to_iso, days)).encode(), digest_size=16).hexdigest() + '"'
+    last_modified = max((_as_utc(sig[2]) for _, sig in days), default=None)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    if _not_modified(if_none_match, if_modified_since, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        body = _stream_ics(db, days, _closed_days(days, from_iso, to_iso), from_iso, to_iso)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB fetch failed: {e}")
+    return StreamingResponse(body, media_type="text/calendar", headers=headers)
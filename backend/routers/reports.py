@@ -1,15 +1,24 @@
 from fastapi import APIRouter, Query, Response, HTTPException
-from typing import List, Dict, Any, Tuple
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Iterable
 from datetime import datetime, timezone
+from itertools import chain, groupby
 import csv, io
 
 try:
-    from backend.core.database import Database
+    from backend.core.database import Database, attendances_is_view
 except Exception:
     Database = None
 
 router = APIRouter(prefix="/api/reports", tags=["reports"])
 
+def _default_source() -> str:
+    # attendance_sessions is folded at write time from the app's own marks only; when `attendances` is a
+    # real table, other writers append check_in/check_out rows to it, so re-pair the raw events instead
+    if Database is None:
+        return "events"
+    return "sessions" if attendances_is_view(Database().engine) else "events"
+
 def _fetch_events(from_iso: str, to_iso: str) -> List[Dict[str, Any]]:
     if Database is None:
         return []
@@ -59,11 +68,126 @@ def _pair_sessions(events: List[Dict[str, Any]]) -> Dict[int, List[Tuple[datetim
             sessions.setdefault(uid, []).append((t, t))
     return sessions
 
+def _iter_event_rows(from_iso: str, to_iso: str) -> Iterator[Tuple]:
+    if Database is None:
+        return iter(())
+    return Database().iter_rows(
+        "SELECT user_id, user_name, event_type, created_at FROM attendances "
+        "WHERE created_at BETWEEN ? AND ? ORDER BY user_id, created_at ASC",
+        (from_iso, to_iso)
+    )
+
+def _parse_ts(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc)
+    s = str(value)
+    try:
+        # C-level parser; covers everything the DB hands back
+        return datetime.fromisoformat(s[:-1] + "+00:00" if s.endswith("Z") else s)
+    except ValueError:
+        from dateutil import parser
+        return parser.isoparse(s)
+
+def _pair_rows(rows: Iterable[Tuple]) -> List[Tuple[datetime, datetime]]:
+    """Single pass over one user's time-ordered rows; same pairing rules as _pair_sessions."""
+    sessions: List[Tuple[datetime, datetime]] = []
+    open_at = None
+    for _, _, event_type, created_at in rows:
+        et = (event_type or "").lower()
+        if et in ("check_in", "in"):
+            open_at = _parse_ts(created_at)
+        elif et in ("check_out", "out"):
+            if open_at:
+                sessions.append((open_at, _parse_ts(created_at)))
+                open_at = None
+        elif et == "attendance":
+            t = _parse_ts(created_at)
+            sessions.append((t, t))
+    return sessions
+
+def _stream_payroll(rows: Iterable[Tuple]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["user_id", "user_name", "sessions", "total_minutes"])
+    for uid, user_rows in groupby(rows, key=lambda r: r[0]):
+        user_rows = list(user_rows)
+        user_name = user_rows[0][1] or f"User {uid}"
+        minutes = 0
+        sess_strs = []
+        for start, end in _pair_rows(user_rows):
+            minutes += max(int((end - start).total_seconds() // 60), 0)
+            sess_strs.append(f"{start.isoformat()} -> {end.isoformat()}")
+        w.writerow([uid, user_name, "; ".join(sess_strs) or "-", minutes])
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def _db_bound(value: str) -> str:
+    # sessions hold naive UTC; render the bound the way the DB stores DateTime so text comparison works on sqlite
+    t = _parse_ts(value)
+    if t.tzinfo:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return t.isoformat(sep=" ", timespec="microseconds")
+
+def _session_ts(value: Any) -> datetime:
+    # already naive UTC; raw sqlite rows come back as text
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+def _iter_session_rows(from_iso: str, to_iso: str) -> Iterator[Tuple]:
+    if Database is None:
+        return iter(())
+    return Database().iter_rows(
+        "SELECT user_id, user_name, started_at, ended_at, minutes FROM attendance_sessions "
+        "WHERE started_at >= ? AND ended_at <= ? ORDER BY user_id, started_at ASC",
+        (_db_bound(from_iso), _db_bound(to_iso))
+    )
+
+def _stream_session_payroll(rows: Iterable[Tuple]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["user_id", "user_name", "sessions", "total_minutes"])
+    for uid, user_rows in groupby(rows, key=lambda r: r[0]):
+        user_name, minutes, sess_strs = None, 0, []
+        for _, name, started_at, ended_at, mins in user_rows:
+            user_name = user_name or name
+            minutes += mins or 0
+            sess_strs.append(f"{_session_ts(started_at).isoformat()} -> {_session_ts(ended_at).isoformat()}")
+        w.writerow([uid, user_name or f"User {uid}", "; ".join(sess_strs) or "-", minutes])
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def _start_stream(rows: Iterator[Tuple]) -> Iterator[Tuple]:
+    # run the query now so DB errors still surface as a 500, not a truncated body
+    try:
+        first = next(rows, None)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB fetch failed: {e}")
+    return chain([first], rows) if first is not None else iter(())
+
 @router.get("/payroll")
 def payroll_csv(
     from_iso: str = Query(..., description="Start datetime ISO (inclusive)"),
-    to_iso: str = Query(..., description="End datetime ISO (inclusive)")
+    to_iso: str = Query(..., description="End datetime ISO (inclusive)"),
+    source: Optional[str] = Query(None, pattern="^(sessions|events)$", description="Precomputed sessions, or re-pair raw events; "
+                                  "defaults to sessions when `attendances` is the app's view, else events"),
+    stream: bool = Query(False, description="Events source: stream rows from an ordered cursor as each user completes")
 ) -> Response:
+    if (source or _default_source()) == "sessions":
+        try:
+            rows = _iter_session_rows(from_iso, to_iso)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid datetime: {e}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"DB fetch failed: {e}")
+        return StreamingResponse(_stream_session_payroll(_start_stream(rows)), media_type="text/csv")
+    if stream:
+        rows = _start_stream(_iter_event_rows(from_iso, to_iso))
+        return StreamingResponse(_stream_payroll(rows), media_type="text/csv")
     try:
         events = _fetch_events(from_iso, to_iso)
     except Exception as e:
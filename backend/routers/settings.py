@@ -1,38 +1,111 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, HttpUrl
-from typing import Optional
-import json, os, pathlib
+from typing import Optional, Tuple
+import copy, json, os, pathlib, stat, tempfile, threading, time
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
 
 SETTINGS_DIR = pathlib.Path(os.getenv("SETTINGS_DIR", "backend/data"))
 SETTINGS_DIR.mkdir(parents=True, exist_ok=True)
 SETTINGS_FILE = SETTINGS_DIR / "settings.json"
+SETTINGS_STAT_INTERVAL = float(os.getenv("SETTINGS_STAT_INTERVAL", "1.0"))
 
 class IntegrationSettings(BaseModel):
     slack_webhook: Optional[HttpUrl] = None
     teams_webhook: Optional[HttpUrl] = None
 
-def _load() -> dict:
-    if SETTINGS_FILE.exists():
+def _default() -> dict:
+    return {"integrations": {"slack_webhook": None, "teams_webhook": None}}
+
+
+class SettingsStore:
+    """Parsed settings.json held in memory. The file is stat'ed at most once per `stat_interval`
+    and re-parsed only when its mtime or size changed; writes go through a temp file + rename,
+    so readers in this or any other process never see a partial file."""
+
+    def __init__(self, path: pathlib.Path, stat_interval: float = SETTINGS_STAT_INTERVAL):
+        self.path = path
+        self.stat_interval = stat_interval
+        self._lock = threading.Lock()
+        self._data: Optional[dict] = None
+        self._sig: Optional[Tuple[int, int]] = None
+        self._checked = 0.0
+        self.reloads = 0
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self) -> dict:
+        """Shared, read-only view of the current settings; copy before changing it."""
+        now = time.monotonic()
+        data = self._data
+        if data is not None and now - self._checked < self.stat_interval:
+            return data
+        with self._lock:
+            self._checked = now
+            sig = self._stat()
+            if self._data is None or sig != self._sig:
+                self._data = self._read(sig)
+                self._sig = sig
+                self.reloads += 1
+            return self._data
+
+    def _read(self, sig: Optional[Tuple[int, int]]) -> dict:
+        if sig is None:
+            return _default()
         try:
-            return json.loads(SETTINGS_FILE.read_text(encoding="utf-8"))
+            return json.loads(self.path.read_text(encoding="utf-8"))
         except Exception:
-            pass
-    return {"integrations": {"slack_webhook": None, "teams_webhook": None}}
+            # hand-edited file mid-save or broken JSON: keep serving what we had
+            return self._data if self._data is not None else _default()
+
+    def save(self, data: dict) -> None:
+        with self._lock:
+            # mkstemp creates 0600; keep the mode other readers of settings.json rely on
+            try:
+                mode = stat.S_IMODE(os.stat(self.path).st_mode)
+            except FileNotFoundError:
+                mode = 0o644
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.chmod(tmp, mode)
+                os.replace(tmp, self.path)
+            except BaseException:
+                try:
+                    os.unlink(tmp)
+                except FileNotFoundError:
+                    pass
+                raise
+            self._data = copy.deepcopy(data)
+            self._sig = self._stat()
+            self._checked = time.monotonic()
+
+
+settings_store = SettingsStore(SETTINGS_FILE)
+
+def _load() -> dict:
+    return copy.deepcopy(settings_store.get())
 
 def _save(data: dict) -> None:
-    SETTINGS_FILE.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    settings_store.save(data)
 
 @router.get("/integrations", response_model=IntegrationSettings)
 def get_integrations():
-    data = _load()
+    data = settings_store.get()
     return IntegrationSettings(**data.get("integrations", {}))
 
 @router.put("/integrations", response_model=IntegrationSettings)
 def put_integrations(payload: IntegrationSettings):
     data = _load()
-    data["integrations"] = payload.dict()
+    data["integrations"] = payload.model_dump(mode="json")
     try:
         _save(data)
     except Exception as e:
@@ -1,17 +1,34 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from backend.app.timeutil import naive_utc
+from backend.app.dedup_index import dedup_index, user_key, DEDUP_INDEX_AUTHORITATIVE
 try:
-    from backend.core.database import Database
+    from backend.core.database import Database, attendances_is_view
 except Exception:
     Database = None
 
 def is_duplicate_event(user_id: int, now: datetime, threshold_minutes: int = 2) -> bool:
     if Database is None:
         return False
+    window = timedelta(minutes=threshold_minutes)
+    now = naive_utc(now)
     db = Database()
-    cutoff = (now - timedelta(minutes=threshold_minutes)).isoformat()
+    # the index is keyed by Person ids from the app's own marks; that is only the same id space when
+    # `attendances` is the app's view. An external events table is always read from the database.
+    indexed = attendances_is_view(db.engine)
+    if indexed:
+        if dedup_index.lookup(user_key(user_id), now, window):
+            return True
+        if DEDUP_INDEX_AUTHORITATIVE:
+            return False
+    cutoff = (now - window).isoformat()
     row = db.fetch_one(
-        "SELECT id FROM attendances WHERE user_id=? AND created_at>=? ORDER BY created_at DESC LIMIT 1",
+        "SELECT id, created_at FROM attendances WHERE user_id=? AND created_at>=? ORDER BY created_at DESC LIMIT 1",
         (user_id, cutoff)
     )
-    return row is not None
+    if row is None:
+        return False
+    event_id, created_at = (row["id"], row["created_at"]) if isinstance(row, dict) else row
+    if indexed and created_at is not None:
+        dedup_index.record(user_key(user_id), naive_utc(created_at), event_id)
+    return True
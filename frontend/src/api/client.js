@@ -26,7 +26,8 @@ export const api = {
     return handle(res);
   },
   async getAttendance() {
-    const res = await fetch(`${BASE_URL}/api/attendance`, { headers: getHeaders() });
+    // the plain endpoint is paged (X-Next-Cursor); export=json returns every row, newest first
+    const res = await fetch(`${BASE_URL}/api/attendance?export=json`, { headers: getHeaders() });
     return handle(res);
   },
   async getRecentUsers() {